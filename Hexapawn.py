@@ -1,15 +1,14 @@
+import argparse
 import pygame
-import numpy as np
 import sys
-import time
-from copy import deepcopy
 
-# Initialize pygame
-pygame.init()
+import engine
+from engine import Engine, Position, ROWS, COLS, MOVE_NAMES, load_default_weights, popcount, square
+from book import Book
+from tablebase import Tablebase
 
 # Constants
 WIDTH, HEIGHT = 600, 600
-ROWS, COLS = 4, 4
 SQUARE_SIZE = WIDTH // COLS
 
 # Colors
@@ -22,12 +21,8 @@ GREEN = (0, 255, 0)
 BROWN = (165, 42, 42)
 YELLOW = (255, 255, 0)  # For selected piece highlight
 
-# Font
-FONT = pygame.font.SysFont('Arial', 32)
-
-# Set up the display
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption('HexaPawn: Strategic Variant with Enhanced AI')
+# Piece colors indexed by engine side
+SIDE_COLORS = (WHITE, BLACK)
 
 class Piece:
     PADDING = 15
@@ -38,409 +33,205 @@ class Piece:
         self.col = col
         self.color = color
         self.is_blocker = is_blocker
-        self.x = 0
-        self.y = 0
-        self.calc_pos()
-
-    def calc_pos(self):
-        self.x = SQUARE_SIZE * self.col + SQUARE_SIZE // 2
-        self.y = SQUARE_SIZE * self.row + SQUARE_SIZE // 2
 
-    def draw(self, win):
+    def draw_at(self, win, x, y):
+        # Draw centred on (x, y)
         radius = SQUARE_SIZE // 2 - self.PADDING
         if self.is_blocker:
             # Draw blocker as a square
-            pygame.draw.rect(win, BROWN, (self.x - SQUARE_SIZE//2 + self.PADDING, 
-                                        self.y - SQUARE_SIZE//2 + self.PADDING, 
+            pygame.draw.rect(win, BROWN, (x - SQUARE_SIZE//2 + self.PADDING, 
+                                        y - SQUARE_SIZE//2 + self.PADDING, 
                                         SQUARE_SIZE - 2*self.PADDING, 
                                         SQUARE_SIZE - 2*self.PADDING))
         else:
             # Draw pawn as a circle
-            pygame.draw.circle(win, self.color, (self.x, self.y), radius)
-            pygame.draw.circle(win, BLACK, (self.x, self.y), radius, self.OUTLINE)
+            pygame.draw.circle(win, self.color, (x, y), radius)
+            pygame.draw.circle(win, BLACK, (x, y), radius, self.OUTLINE)
 
     def move(self, row, col):
         self.row = row
         self.col = col
-        self.calc_pos()
 
 class Board:
-    def __init__(self):
+    def __init__(self, on_stats=None, ponder=False):
         self.board = []
-        self.white_left = self.black_left = 4
-        self.white_blockers = self.black_blockers = 1
+        self.position = Position.initial()
+        # Shared across turns so each search reuses the previous one's work;
+        # plays perfectly from the solved tablebase when its file is present,
+        # and opens from the book, which is only read on its first probe.
+        # Searches use the tuned weights from weights.json when present.
+        # on_stats receives an engine.SearchStats after every AI move.
+        self.engine = Engine(tablebase=Tablebase.load_default(), on_stats=on_stats, book=Book.load_default(),
+                             weights=load_default_weights())
+        # Search the expected reply while the player thinks
+        self.ponder = ponder
+        # Every move played, for the game record
+        self.history = []
         self.create_board()
 
-    def draw_squares(self, win):
-        win.fill(WHITE)
-        for row in range(ROWS):
-            for col in range(row % 2, ROWS, 2):
-                pygame.draw.rect(win, GRAY, (row * SQUARE_SIZE, col * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-
     def create_board(self):
+        # Rebuild the piece view from the engine position
+        self.board = []
         for row in range(ROWS):
             self.board.append([])
             for col in range(COLS):
-                if row == 0:
-                    self.board[row].append(Piece(row, col, BLACK))
-                elif row == ROWS - 1:
-                    self.board[row].append(Piece(row, col, WHITE))
-                elif row == 1 and col == 1:
-                    self.board[row].append(Piece(row, col, BLACK, True))
-                elif row == ROWS - 2 and col == COLS - 2:
-                    self.board[row].append(Piece(row, col, WHITE, True))
-                else:
+                piece = self.position.piece_at(square(row, col))
+                if piece is None:
                     self.board[row].append(0)
-
-    def draw(self, win):
-        self.draw_squares(win)
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.board[row][col]
-                if piece != 0:
-                    piece.draw(win)
+                else:
+                    side, is_blocker = piece
+                    self.board[row].append(Piece(row, col, SIDE_COLORS[side], is_blocker))
+        self.white_left = popcount(self.position.pawns[engine.WHITE])
+        self.black_left = popcount(self.position.pawns[engine.BLACK])
+        self.white_blockers = popcount(self.position.blockers[engine.WHITE])
+        self.black_blockers = popcount(self.position.blockers[engine.BLACK])
 
     def move(self, piece, row, col):
-        self.board[piece.row][piece.col], self.board[row][col] = self.board[row][col], self.board[piece.row][piece.col]
-        piece.move(row, col)
+        move_type = self.get_valid_moves(piece)[(row, col)]
+        move = (square(piece.row, piece.col), square(row, col), MOVE_NAMES.index(move_type))
+        self.position.make(move)
+        self.history.append(move)
+        self.create_board()
 
     def get_piece(self, row, col):
         return self.board[row][col]
 
+    def square_key(self, row, col):
+        # What the square shows: its shade and its piece as (color, is_blocker)
+        piece = self.board[row][col]
+        shade = GRAY if (row + col) % 2 == 0 else WHITE
+        return shade, None if piece == 0 else (piece.color, piece.is_blocker)
+
     def get_valid_moves(self, piece):
         moves = {}
-        left = piece.col - 1
-        right = piece.col + 1
-        row = piece.row
-
-        if piece.color == WHITE:
-            # White pawn moves (moving up the board)
-            if piece.is_blocker:
-                return moves  # Blockers can't move
-            
-            # Forward move
-            if row - 1 >= 0:
-                if self.board[row - 1][piece.col] == 0:
-                    moves[(row - 1, piece.col)] = "move"
-                # Capture left
-                if left >= 0 and self.board[row - 1][left] != 0 and self.board[row - 1][left].color != piece.color and not self.board[row - 1][left].is_blocker:
-                    moves[(row - 1, left)] = "capture"
-                # Capture right
-                if right < COLS and self.board[row - 1][right] != 0 and self.board[row - 1][right].color != piece.color and not self.board[row - 1][right].is_blocker:
-                    moves[(row - 1, right)] = "capture"
-            
-            # Push mechanics for white
-            if row - 1 >= 0 and piece.col + 1 < COLS:
-                if (self.board[row][piece.col + 1] != 0 and 
-                    self.board[row][piece.col + 1].color == WHITE and 
-                    not self.board[row][piece.col + 1].is_blocker and
-                    self.board[row - 1][piece.col + 1] != 0 and 
-                    self.board[row - 1][piece.col + 1].is_blocker and
-                    self.board[row - 1][piece.col + 1].color != WHITE):
-                    moves[(row - 1, piece.col + 1)] = "push"
-            
-            if row - 1 >= 0 and piece.col - 1 >= 0:
-                if (self.board[row][piece.col - 1] != 0 and 
-                    self.board[row][piece.col - 1].color == WHITE and 
-                    not self.board[row][piece.col - 1].is_blocker and
-                    self.board[row - 1][piece.col - 1] != 0 and 
-                    self.board[row - 1][piece.col - 1].is_blocker and
-                    self.board[row - 1][piece.col - 1].color != WHITE):
-                    moves[(row - 1, piece.col - 1)] = "push"
-
-        else:
-            # Black pawn moves (moving down the board)
-            if piece.is_blocker:
-                return moves  # Blockers can't move
-            
-            # Forward move
-            if row + 1 < ROWS:
-                if self.board[row + 1][piece.col] == 0:
-                    moves[(row + 1, piece.col)] = "move"
-                # Capture left
-                if left >= 0 and self.board[row + 1][left] != 0 and self.board[row + 1][left].color != piece.color and not self.board[row + 1][left].is_blocker:
-                    moves[(row + 1, left)] = "capture"
-                # Capture right
-                if right < COLS and self.board[row + 1][right] != 0 and self.board[row + 1][right].color != piece.color and not self.board[row + 1][right].is_blocker:
-                    moves[(row + 1, right)] = "capture"
-            
-            # Push mechanics for black
-            if row + 1 < ROWS and piece.col + 1 < COLS:
-                if (self.board[row][piece.col + 1] != 0 and 
-                    self.board[row][piece.col + 1].color == BLACK and 
-                    not self.board[row][piece.col + 1].is_blocker and
-                    self.board[row + 1][piece.col + 1] != 0 and 
-                    self.board[row + 1][piece.col + 1].is_blocker and
-                    self.board[row + 1][piece.col + 1].color != BLACK):
-                    moves[(row + 1, piece.col + 1)] = "push"
-            
-            if row + 1 < ROWS and piece.col - 1 >= 0:
-                if (self.board[row][piece.col - 1] != 0 and 
-                    self.board[row][piece.col - 1].color == BLACK and 
-                    not self.board[row][piece.col - 1].is_blocker and
-                    self.board[row + 1][piece.col - 1] != 0 and 
-                    self.board[row + 1][piece.col - 1].is_blocker and
-                    self.board[row + 1][piece.col - 1].color != BLACK):
-                    moves[(row + 1, piece.col - 1)] = "push"
-
+        side = SIDE_COLORS.index(piece.color)
+        for _, to, kind in self.position.piece_moves(square(piece.row, piece.col), side):
+            moves[divmod(to, COLS)] = MOVE_NAMES[kind]
         return moves
 
     def winner(self):
-        # Check if white reached the top row
-        for col in range(COLS):
-            if self.board[0][col] != 0 and self.board[0][col].color == WHITE and not self.board[0][col].is_blocker:
-                return WHITE
-        
-        # Check if black reached the bottom row
-        for col in range(COLS):
-            if self.board[ROWS - 1][col] != 0 and self.board[ROWS - 1][col].color == BLACK and not self.board[ROWS - 1][col].is_blocker:
-                return BLACK
-        
-        # Check if all white pawns are gone
-        white_pawns = 0
-        black_pawns = 0
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.board[row][col]
-                if piece != 0 and not piece.is_blocker:
-                    if piece.color == WHITE:
-                        white_pawns += 1
-                    else:
-                        black_pawns += 1
-        
-        if white_pawns == 0:
-            return BLACK
-        if black_pawns == 0:
-            return WHITE
-        
-        return None
+        side = self.position.winner()
+        return None if side is None else SIDE_COLORS[side]
 
     def has_legal_moves(self, color):
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.board[row][col]
-                if piece != 0 and piece.color == color and not piece.is_blocker:
-                    if len(self.get_valid_moves(piece)) > 0:
-                        return True
-        return False
+        return self.position.has_legal_moves(SIDE_COLORS.index(color))
 
-    def ai_move(self, board):
-        start_time = time.time()
-        best_move = None
-        best_value = -float('inf')
-        alpha = -float('inf')
-        beta = float('inf')
-        max_depth = 4  # Limit the search depth
-        
-        # Get all possible moves for black
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.board[row][col]
-                if piece != 0 and piece.color == BLACK and not piece.is_blocker:
-                    moves = board.get_valid_moves(piece)
-                    for move, move_type in moves.items():
-                        new_row, new_col = move
-                        temp_board = deepcopy(board)
-                        temp_piece = temp_board.get_piece(row, col)
-                        
-                        # Make the move on the temp board
-                        if move_type == "move":
-                            temp_board.move(temp_piece, new_row, new_col)
-                        elif move_type == "capture":
-                            temp_board.board[new_row][new_col] = 0
-                            temp_board.move(temp_piece, new_row, new_col)
-                            temp_board.white_left -= 1
-                        elif move_type == "push":
-                            temp_board.board[new_row][new_col] = 0
-                            temp_board.move(temp_piece, new_row, new_col)
-                            temp_board.white_blockers -= 1
-                        
-                        # Evaluate the move
-                        board_value = self.minimax(temp_board, max_depth, False, alpha, beta, max_depth)
-                        
-                        if board_value > best_value:
-                            best_value = board_value
-                            best_move = (piece, move, move_type)
-        
-        end_time = time.time()
-        print(f"AI move took {end_time - start_time:.2f} seconds")
-        
+    def ai_move(self, board, time_limit=None):
+        return self.finish_ai_move(self.engine.choose_move(board.position, time_limit))
+
+    def start_ai_move(self, time_limit=None):
+        # Search on a worker thread; poll the returned handle each frame
+        return self.engine.start_move(self.position, time_limit)
+
+    def finish_ai_move(self, best_move):
         if best_move:
-            piece, move, move_type = best_move
-            new_row, new_col = move
-            if move_type == "move":
-                self.move(piece, new_row, new_col)
-            elif move_type == "capture":
-                self.board[new_row][new_col] = 0
-                self.move(piece, new_row, new_col)
-                self.white_left -= 1
-            elif move_type == "push":
-                self.board[new_row][new_col] = 0
-                self.move(piece, new_row, new_col)
-                self.white_blockers -= 1
+            self.position.make(best_move)
+            self.history.append(best_move)
+            self.create_board()
+            if self.ponder:
+                self.engine.ponder(self.position)
             return True
         return False
 
-    def minimax(self, board, depth, maximizing_player, alpha, beta, max_depth=4):
-        # Base cases
-        winner = board.winner()
-        if winner == BLACK:
-            return float('inf')
-        elif winner == WHITE:
-            return -float('inf')
-        elif depth == 0 or not board.has_legal_moves(BLACK if maximizing_player else WHITE):
-            return self.evaluate(board)
-        
-        # Prevent infinite recursion
-        if depth > max_depth:
-            return self.evaluate(board)
-        
-        if maximizing_player:
-            max_eval = -float('inf')
-            for row in range(ROWS):
-                for col in range(COLS):
-                    piece = board.board[row][col]
-                    if piece != 0 and piece.color == BLACK and not piece.is_blocker:
-                        moves = board.get_valid_moves(piece)
-                        for move, move_type in moves.items():
-                            new_row, new_col = move
-                            temp_board = deepcopy(board)
-                            temp_piece = temp_board.get_piece(row, col)
-                            
-                            if move_type == "move":
-                                temp_board.move(temp_piece, new_row, new_col)
-                            elif move_type == "capture":
-                                temp_board.board[new_row][new_col] = 0
-                                temp_board.move(temp_piece, new_row, new_col)
-                                temp_board.white_left -= 1
-                            elif move_type == "push":
-                                temp_board.board[new_row][new_col] = 0
-                                temp_board.move(temp_piece, new_row, new_col)
-                                temp_board.white_blockers -= 1
-                            
-                            evaluation = self.minimax(temp_board, depth - 1, False, alpha, beta, max_depth)
-                            max_eval = max(max_eval, evaluation)
-                            alpha = max(alpha, evaluation)
-                            if beta <= alpha:
-                                break
-                        if beta <= alpha:
-                            break
-            return max_eval
-        else:
-            min_eval = float('inf')
-            for row in range(ROWS):
-                for col in range(COLS):
-                    piece = board.board[row][col]
-                    if piece != 0 and piece.color == WHITE and not piece.is_blocker:
-                        moves = board.get_valid_moves(piece)
-                        for move, move_type in moves.items():
-                            new_row, new_col = move
-                            temp_board = deepcopy(board)
-                            temp_piece = temp_board.get_piece(row, col)
-                            
-                            if move_type == "move":
-                                temp_board.move(temp_piece, new_row, new_col)
-                            elif move_type == "capture":
-                                temp_board.board[new_row][new_col] = 0
-                                temp_board.move(temp_piece, new_row, new_col)
-                                temp_board.black_left -= 1
-                            elif move_type == "push":
-                                temp_board.board[new_row][new_col] = 0
-                                temp_board.move(temp_piece, new_row, new_col)
-                                temp_board.black_blockers -= 1
-                            
-                            evaluation = self.minimax(temp_board, depth - 1, True, alpha, beta, max_depth)
-                            min_eval = min(min_eval, evaluation)
-                            beta = min(beta, evaluation)
-                            if beta <= alpha:
-                                break
-                        if beta <= alpha:
-                            break
-            return min_eval
+    def minimax(self, board, depth, maximizing_player, alpha, beta):
+        return engine.minimax(board.position, depth, maximizing_player, alpha, beta)
 
     def evaluate(self, board):
-        # Piece values
-        pawn_value = 1
-        blocker_value = 2
-        
-        # Material score
-        white_score = 0
-        black_score = 0
-        
-        # Count pieces and calculate material score
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.board[row][col]
-                if piece != 0:
-                    if piece.color == WHITE:
-                        if piece.is_blocker:
-                            white_score += blocker_value
-                        else:
-                            white_score += pawn_value
-                            # Add positional bonus for white pieces
-                            white_score += (ROWS - row) * 0.1  # Closer to promotion is better
-                    else:
-                        if piece.is_blocker:
-                            black_score += blocker_value
-                        else:
-                            black_score += pawn_value
-                            # Add positional bonus for black pieces
-                            black_score += row * 0.1  # Closer to promotion is better
-        
-        # Center control bonus
-        center_squares = [(1,1), (1,2), (2,1), (2,2)]
-        for (row, col) in center_squares:
-            piece = board.board[row][col]
-            if piece != 0:
-                if piece.color == WHITE:
-                    white_score += 0.2
-                else:
-                    black_score += 0.2
-        
-        # Mobility score (weighted more heavily)
-        white_moves = 0
-        black_moves = 0
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = board.board[row][col]
-                if piece != 0 and not piece.is_blocker:
-                    moves = board.get_valid_moves(piece)
-                    if piece.color == WHITE:
-                        white_moves += len(moves)
-                    else:
-                        black_moves += len(moves)
-        
-        white_score += white_moves * 0.15
-        black_score += black_moves * 0.15
-        
-        # King safety (pieces near the back row)
-        for col in range(COLS):
-            if board.board[0][col] != 0 and board.board[0][col].color == WHITE:
-                white_score += 0.3
-            if board.board[ROWS-1][col] != 0 and board.board[ROWS-1][col].color == BLACK:
-                black_score += 0.3
-        
-        return black_score - white_score
+        return board.position.evaluate()
 
 class Game:
-    def __init__(self, win):
+    def __init__(self, win, on_stats=None, ponder=False, record=None):
         self.win = win
-        self.board = Board()
+        self.board = Board(on_stats, ponder)
         self.turn = WHITE
         self.selected = None
         self.valid_moves = {}
         self.game_over = False
+        # Handle of the AI search in progress, if any
+        self.pending = None
+        self.font = None
+        # Rendered square surfaces by square_key, and the key each square
+        # on screen was last drawn with
+        self.tiles = {}
+        self.drawn = {}
+        # Game record file the finished or abandoned game is appended to
+        self.record = record
 
     def update(self):
-        self.board.draw(self.win)
-        self.draw_valid_moves(self.valid_moves)
-        if self.selected:
-            self.highlight_selected()
-        pygame.display.update()
-
-    def highlight_selected(self):
-        row, col = self.selected.row, self.selected.col
-        pygame.draw.rect(self.win, YELLOW, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3)
+        # Only squares whose key changed since the last frame are redrawn and
+        # sent to the display
+        dirty = []
+        for row in range(ROWS):
+            for col in range(COLS):
+                key = self.square_key(row, col)
+                if self.drawn.get((row, col)) != key:
+                    self.drawn[(row, col)] = key
+                    rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+                    self.win.blit(self.tile(key), rect)
+                    dirty.append(rect)
+        if dirty:
+            pygame.display.update(dirty)
+
+    def invalidate(self):
+        # The window was drawn over or exposed; repaint everything next frame
+        self.drawn = {}
+
+    def square_key(self, row, col):
+        # Everything that decides a square's pixels: board contents, move
+        # marker, selection and, in the corner, the thinking label
+        marker = self.valid_moves.get((row, col))
+        selected = self.selected is not None and (self.selected.row, self.selected.col) == (row, col)
+        label = None
+        if self.pending is not None and (row, col) == (0, 0):
+            label = "Thinking" + "." * (pygame.time.get_ticks() // 300 % 4)
+        return self.board.square_key(row, col) + (marker, selected, label)
+
+    def tile(self, key):
+        surface = self.tiles.get(key)
+        if surface is None:
+            surface = self.tiles[key] = self.render_tile(key)
+        return surface
+
+    def render_tile(self, key):
+        shade, piece, marker, selected, label = key
+        surface = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
+        surface.fill(shade)
+        center = SQUARE_SIZE // 2
+        if piece is not None:
+            color, is_blocker = piece
+            Piece(0, 0, color, is_blocker).draw_at(surface, center, center)
+        if marker is not None:
+            color = GREEN if marker == "move" else RED if marker == "capture" else BLUE
+            pygame.draw.circle(surface, color, (center, center), 15)
+        if selected:
+            pygame.draw.rect(surface, YELLOW, (0, 0, SQUARE_SIZE, SQUARE_SIZE), 3)
+        if label is not None:
+            if self.font is None:
+                self.font = pygame.font.SysFont('Arial', 24)
+            surface.blit(self.font.render(label, True, RED), (10, 10))
+        return surface
+
+    def close(self):
+        # Abandon any search still running
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.board.engine.close()
+        self.save_record()
+
+    def save_record(self, result=None):
+        # Append the game once: with its result when it ends, otherwise as
+        # unfinished when the window is closed
+        if self.record is None:
+            return
+        from records import UNFINISHED, GameWriter
+        if result is None:
+            side = UNFINISHED
+        else:
+            side = SIDE_COLORS.index(result) if result in SIDE_COLORS else None
+        with GameWriter(self.record) as writer:
+            writer.write_game(self.board.history, side)
+        self.record = None
 
     def select(self, row, col):
         piece = self.board.get_piece(row, col)
@@ -461,35 +252,11 @@ class Game:
     def _move(self, row, col):
         piece = self.board.get_piece(row, col)
         if self.selected and (row, col) in self.valid_moves and (piece == 0 or piece.color != self.turn):
-            move_type = self.valid_moves[(row, col)]
-            
-            if move_type == "move":
-                self.board.move(self.selected, row, col)
-            elif move_type == "capture":
-                self.board.board[row][col] = 0
-                self.board.move(self.selected, row, col)
-                if self.turn == WHITE:
-                    self.board.black_left -= 1
-                else:
-                    self.board.white_left -= 1
-            elif move_type == "push":
-                self.board.board[row][col] = 0  # Remove the blocker
-                self.board.move(self.selected, row, col)
-                if self.turn == WHITE:
-                    self.board.black_blockers -= 1
-                else:
-                    self.board.white_blockers -= 1
-            
+            self.board.move(self.selected, row, col)
             self.change_turn()
             return True
         return False
 
-    def draw_valid_moves(self, moves):
-        for move, move_type in moves.items():
-            row, col = move
-            color = GREEN if move_type == "move" else RED if move_type == "capture" else BLUE
-            pygame.draw.circle(self.win, color, (col * SQUARE_SIZE + SQUARE_SIZE//2, row * SQUARE_SIZE + SQUARE_SIZE//2), 15)
-
     def change_turn(self):
         self.valid_moves = {}
         self.selected = None
@@ -513,6 +280,7 @@ class Game:
         return None
 
     def show_game_over(self, result):
+        self.save_record(result)
         if result == WHITE:
             text = "White wins!"
         elif result == BLACK:
@@ -520,7 +288,8 @@ class Game:
         else:
             text = "Game ended in a draw!"
         
-        text_surface = FONT.render(text, True, BLACK)
+        font = pygame.font.SysFont('Arial', 32)
+        text_surface = font.render(text, True, BLACK)
         text_rect = text_surface.get_rect(center=(WIDTH//2, HEIGHT//2))
         
         # Create a semi-transparent background
@@ -530,11 +299,20 @@ class Game:
         
         self.win.blit(text_surface, text_rect)
         pygame.display.update()
+        self.invalidate()
         pygame.time.delay(3000)
 
     def ai_turn(self):
+        # Called once a frame: start the search, then collect it when it is done
         if self.turn == BLACK and not self.game_over:
-            moved = self.board.ai_move(self.board)
+            if self.pending is None:
+                self.pending = self.board.start_ai_move()
+                return
+            if not self.pending.done():
+                return
+            best_move = self.pending.result()
+            self.pending = None
+            moved = self.board.finish_ai_move(best_move)
             if moved:
                 self.change_turn()
             else:
@@ -543,10 +321,23 @@ class Game:
                 pygame.quit()
                 sys.exit()
 
-def main():
+def print_stats(stats):
+    print(f"AI move: {stats.summary()}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play Hexapawn against the engine.")
+    parser.add_argument("--stats", action="store_true", help="print search statistics after each AI move")
+    parser.add_argument("--ponder", action="store_true", help="let the AI search while you think")
+    parser.add_argument("--record", metavar="PATH", help="append the game to this binary record file")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption('HexaPawn: Strategic Variant with Enhanced AI')
+
     run = True
     clock = pygame.time.Clock()
-    game = Game(WIN)
+    game = Game(win, print_stats if args.stats else None, args.ponder, args.record)
     
     while run:
         clock.tick(60)
@@ -555,7 +346,11 @@ def main():
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                game.close()
                 run = False
+
+            if event.type == pygame.WINDOWEXPOSED:
+                game.invalidate()
             
             if event.type == pygame.MOUSEBUTTONDOWN and game.turn == WHITE and not game.game_over:
                 pos = pygame.mouse.get_pos()
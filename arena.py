@@ -0,0 +1,261 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+from engine import BLACK, WHITE, Engine, Position, TranspositionTable, decode_move, encode_move, load_weights
+
+RESULT_NAMES = {WHITE: "white", BLACK: "black", None: "draw"}
+RESULT_SIDES = {name: side for side, name in RESULT_NAMES.items()}
+
+# Engine settings an arena player may override, with their parsers
+PLAYER_OPTIONS = {
+    "depth": int,
+    "time": float,
+    "tt": int,
+    "tb": int,
+    "batch": int,
+    "book": int,
+    "weights": str,
+}
+
+_tablebase = None
+_book = None
+
+
+def parse_player(spec):
+    # "depth=4,time=0.05" -> {"depth": 4, "time": 0.05}
+    options = {}
+    for item in filter(None, spec.split(",")):
+        key, _, value = item.partition("=")
+        if key not in PLAYER_OPTIONS:
+            raise ValueError(f"unknown player option {key!r} in {spec!r}")
+        options[key] = PLAYER_OPTIONS[key](value)
+    return options
+
+
+def make_engine(options):
+    global _tablebase, _book
+    tablebase = None
+    if options.get("tb"):
+        if _tablebase is None:
+            from tablebase import Tablebase
+            _tablebase = Tablebase()
+        tablebase = _tablebase
+    book = None
+    if options.get("book"):
+        if _book is None:
+            from book import Book
+            _book = Book()
+        book = _book
+    weights = load_weights(options["weights"]) if options.get("weights") else None
+    leaf_evaluator = None
+    if options.get("batch"):
+        # Scores with the weights of the board the engine searches, which carries `weights`
+        from vectorized import evaluate_bitboards as leaf_evaluator
+    return Engine(max_depth=options.get("depth", 4),
+                  time_limit=options.get("time"),
+                  tt=TranspositionTable(options.get("tt", 4)),
+                  tablebase=tablebase,
+                  leaf_evaluator=leaf_evaluator,
+                  book=book,
+                  weights=weights)
+
+
+def play_game(engines, opening, moves=None):
+    # engines is indexed by side; opening is a list of moves played first.
+    # Returns the winner, None for a draw, and the move times per side.
+    # Every move, opening included, is appended to `moves` when given.
+    pos = Position.initial()
+    times = ([], [])
+    for move in opening:
+        pos.make(move)
+    if moves is not None:
+        moves.extend(opening)
+    while True:
+        over, winner = pos.outcome()
+        if over:
+            return winner, times
+        side = pos.side
+        start_time = time.perf_counter()
+        move = engines[side].choose_move(pos)
+        times[side].append(time.perf_counter() - start_time)
+        pos.make(move)
+        if moves is not None:
+            moves.append(move)
+
+
+def random_opening(rng, plies):
+    pos = Position.initial()
+    opening = []
+    for _ in range(plies):
+        moves = pos.generate_moves()
+        if pos.winner() is not None or not moves:
+            break
+        move = rng.choice(moves)
+        opening.append(move)
+        pos.make(move)
+    return opening
+
+
+def _run_game(task):
+    index, players, a_is_white, opening = task
+    first, second = (players[0], players[1]) if a_is_white else (players[1], players[0])
+    engines = (make_engine(parse_player(first)), make_engine(parse_player(second)))
+    moves = []
+    winner, times = play_game(engines, opening, moves)
+    return {
+        "game": index,
+        "white": first,
+        "black": second,
+        "opening": [list(move) for move in opening],
+        "result": RESULT_NAMES[winner],
+        "plies": len(moves),
+        "moves": [encode_move(move) for move in moves],
+        "white_times": times[WHITE],
+        "black_times": times[BLACK],
+    }
+
+
+def tasks(players, games, opening_plies, seed):
+    # Each random opening is played twice with colors swapped
+    rng = random.Random(seed)
+    for pair in range((games + 1) // 2):
+        opening = random_opening(rng, opening_plies)
+        for a_is_white in (True, False):
+            index = 2 * pair + (not a_is_white)
+            if index < games:
+                yield index, players, a_is_white, opening
+
+
+def play_match(pool, players, games, opening_plies, seed):
+    # Game records from a process pool, in the order the games finish
+    return pool.imap_unordered(_run_game, tasks(players, games, opening_plies, seed), chunksize=8)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * fraction
+    low = math.floor(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def summarize(records, player):
+    # Win/draw/loss for `player` with a 95% interval on its score and the Elo difference
+    wins = draws = losses = 0
+    latencies = []
+    for record in records:
+        if record["white"] == player:
+            side, times = "white", record["white_times"]
+        elif record["black"] == player:
+            side, times = "black", record["black_times"]
+        else:
+            continue
+        latencies.extend(times)
+        if record["result"] == "draw":
+            draws += 1
+        elif record["result"] == side:
+            wins += 1
+        else:
+            losses += 1
+    games = wins + draws + losses
+    summary = {"player": player, "games": games, "wins": wins, "draws": draws, "losses": losses}
+    if games:
+        score = (wins + 0.5 * draws) / games
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+        margin = 1.96 * math.sqrt(variance / games)
+        low, high = max(score - margin, 0.0), min(score + margin, 1.0)
+        summary.update(score=score, score_ci=(low, high),
+                       elo=elo(score), elo_ci=(elo(low), elo(high)))
+    summary["latency_ms"] = {f"p{int(p * 100)}": percentile(latencies, p) * 1000 for p in (0.5, 0.9, 0.99)}
+    summary["latency_ms"]["max"] = max(latencies, default=float("nan")) * 1000
+    summary["moves"] = len(latencies)
+    return summary
+
+
+def elo(score):
+    if score <= 0:
+        return -float("inf")
+    if score >= 1:
+        return float("inf")
+    return 400 * math.log10(score / (1 - score))
+
+
+def print_summary(summary):
+    print(f"{summary['player']}: {summary['games']} games, "
+          f"+{summary['wins']} ={summary['draws']} -{summary['losses']}")
+    if summary["games"]:
+        low, high = summary["score_ci"]
+        elo_low, elo_high = summary["elo_ci"]
+        print(f"  score {summary['score']:.3f} (95% CI {low:.3f}-{high:.3f}), "
+              f"Elo {summary['elo']:+.0f} ({elo_low:+.0f} to {elo_high:+.0f})")
+    latency = summary["latency_ms"]
+    print(f"  {summary['moves']} moves, latency p50 {latency['p50']:.2f} ms, "
+          f"p90 {latency['p90']:.2f} ms, p99 {latency['p99']:.2f} ms, max {latency['max']:.2f} ms")
+
+
+def read_records(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine configurations against each other.")
+    parser.add_argument("-a", "--player-a", default="depth=4",
+                        help="engine options, e.g. depth=4,time=0.05,tt=4,tb=1,batch=1,book=1,"
+                             "weights=weights.json")
+    parser.add_argument("-b", "--player-b", default="depth=2")
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("--opening-plies", type=int, default=2, help="random plies before the engines take over")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", default="arena.jsonl", help="per-game results, one JSON object per line")
+    parser.add_argument("--report", metavar="PATH", help="only summarize an existing results file")
+    parser.add_argument("--record", metavar="PATH", help="also append every game to this binary record file")
+    args = parser.parse_args(argv)
+
+    if args.report:
+        records = list(read_records(args.report))
+        for player in sorted({r["white"] for r in records} | {r["black"] for r in records}):
+            print_summary(summarize(records, player))
+        return 0
+
+    players = (args.player_a, args.player_b)
+    if players[0] == players[1]:
+        parser.error("the two players need different settings")
+    for spec in players:
+        parse_player(spec)
+
+    start_time = time.perf_counter()
+    records = []
+    writer = None
+    if args.record:
+        from records import GameWriter
+        writer = GameWriter(args.record)
+    with open(args.output, "w") as out, Pool(args.workers) as pool:
+        for record in play_match(pool, players, args.games, args.opening_plies, args.seed):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if writer is not None:
+                writer.write_game([decode_move(value) for value in record["moves"]], RESULT_SIDES[record["result"]])
+            records.append(record)
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"{len(records)} games in {elapsed:.1f} s with {args.workers} workers, results in {args.output}")
+    for player in players:
+        print_summary(summarize(records, player))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from engine import Engine, Geometry, Position, Search, SearchStats, TranspositionTable, move_text, perft
+
+# Curated positions with their perft counts at depths 1..len(counts), all
+# checked against the original deepcopy-based rules
+CORPUS = [
+    ("start", "bbbb/.B../..W./wwww w", [3, 9, 25, 72, 216, 611, 1567, 3473, 6786, 11334]),
+    ("open-file", "bbb./.B.b/wwW./..ww b", [3, 10, 36, 98, 228, 501]),
+    ("wide-center", ".bbb/bB../.wWw/w.w. b", [4, 12, 38, 95, 187, 338]),
+    ("blocked-wing", "bb../.Bbb/w.Ww/.ww. w", [3, 10, 34, 77, 175, 317]),
+    ("crossed", ".b.b/bBb./.wWw/w.w. w", [5, 19, 63, 114, 192, 264]),
+    ("push-ready", ".b.b/bBb./wwWw/..w. b", [4, 13, 42, 76, 151, 218]),
+    ("after-push", ".bb./bw.b/.wW./..ww b", [5, 13, 34, 65, 101, 180]),
+]
+
+SEARCH_DEPTH = 10
+# Seconds the simulated opponent spends on each move in the ponder games
+PONDER_THINK_TIME = 0.03
+# Square boards for the size scaling run, and the per-size budgets
+BOARD_SIZES = (4, 5, 6, 7, 8)
+SIZE_PERFT_TIME = 0.5
+SIZE_SEARCH_TIME = 2.0
+# Self-play games driven over the text protocol after random opening plies,
+# and moves of them replayed with a fresh engine process each
+PROTOCOL_GAMES = 20
+PROTOCOL_OPENING_PLIES = 2
+SPAWN_MOVES = 20
+
+# Metrics where a larger value is better; everything else should shrink
+HIGHER_IS_BETTER = {"perft_nps", "search_nps", "eval_per_s", "ponder_hit_rate", "protocol_moves_per_s",
+                    "spawn_moves_per_s"}
+HIGHER_IS_BETTER |= {f"size_{size}x{size}_{metric}" for size in BOARD_SIZES
+                     for metric in ("perft_nps", "perft_depth", "search_nps", "search_depth")}
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def check_perft():
+    failures = []
+    nodes = 0
+    for name, text, counts in CORPUS:
+        pos = Position.from_text(text)
+        for depth, expected in enumerate(counts, 1):
+            got = perft(pos, depth)
+            nodes += got
+            if got != expected:
+                failures.append(f"{name} perft({depth}) = {got}, expected {expected}")
+    return failures, nodes
+
+
+def play_ponder_games(ponder, think_time):
+    # The engine plays the side to move in every corpus position against a
+    # depth-2 opponent that takes think_time per move. Returns the engine's
+    # latency on each move after its first, which has nothing to ponder on,
+    # and how many of those were ponder hits.
+    latencies = []
+    hits = 0
+    for _, text, _ in CORPUS:
+        pos = Position.from_text(text)
+        ai_side = pos.side
+        ai = Engine(max_depth=SEARCH_DEPTH, instrument=True)
+        opponent = Engine(max_depth=2)
+        first = True
+        while pos.winner() is None and pos.has_legal_moves(pos.side):
+            start_time = time.perf_counter()
+            if pos.side == ai_side:
+                move = ai.choose_move(pos)
+                if not first:
+                    latencies.append(time.perf_counter() - start_time)
+                    hits += ai.stats.ponder_hit
+                first = False
+                pos.make(move)
+                if ponder:
+                    ai.ponder(pos)
+            else:
+                move = opponent.choose_move(pos)
+                time.sleep(max(0.0, think_time - (time.perf_counter() - start_time)))
+                pos.make(move)
+        ai.close()
+    return latencies, hits
+
+
+def run_ponder(repeat):
+    # Mean engine latency with and without pondering, best of `repeat` runs each
+    # and the share of ponder hits in the best pondering run
+    metrics = {}
+    for name, ponder in (("ai_move_warm_ms", False), ("ai_move_ponder_ms", True)):
+        best = best_hits = None
+        for _ in range(repeat):
+            latencies, hits = play_ponder_games(ponder, PONDER_THINK_TIME)
+            if best is None or sum(latencies) < sum(best):
+                best, best_hits = latencies, hits
+        metrics[name] = statistics.mean(best) * 1000 if best else None
+        if ponder:
+            metrics["ponder_hit_rate"] = best_hits / len(best) if best else None
+    return metrics
+
+
+def run_sizes(perft_time=SIZE_PERFT_TIME, search_time=SIZE_SEARCH_TIME):
+    # From each start position: perft nodes/s at the deepest depth finished
+    # within perft_time, and the nodes/s and depth of a search given search_time
+    metrics = {}
+    for size in BOARD_SIZES:
+        pos = Position.initial(Geometry(size, size))
+        name = f"size_{size}x{size}"
+        # Summed over depths 1..d, the leaf counts add up to the nodes visited
+        depth = nodes = 0
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < perft_time and depth < pos.geometry.max_plies:
+            depth += 1
+            nodes += perft(pos, depth)
+        metrics[name + "_perft_depth"] = depth
+        metrics[name + "_perft_nps"] = nodes / (time.perf_counter() - start_time)
+
+        stats = SearchStats()
+        Search(TranspositionTable(), time_limit=search_time, stats=stats).iterate(pos)
+        metrics[name + "_search_depth"] = stats.depth
+        metrics[name + "_search_nps"] = stats.nps
+    return metrics
+
+
+def run_protocol(games=PROTOCOL_GAMES, spawn_moves=SPAWN_MOVES):
+    # Moves per second over the text protocol: every game from one warm
+    # engine process, against a new process started for every move
+    from protocol import EngineProcess
+
+    rng = random.Random(1)
+    start = Position.initial().to_text()
+    played = []
+    start_time = time.perf_counter()
+    engine = EngineProcess()
+    for _ in range(games):
+        engine.send("newgame")
+        pos = Position.initial()
+        opening = []
+        for _ in range(PROTOCOL_OPENING_PLIES):
+            move = rng.choice(pos.generate_moves())
+            pos.make(move)
+            opening.append(move_text(move))
+        moves = []
+        # The protocol reports no result, so the client follows the game itself
+        while pos.winner() is None:
+            word = engine.best_move(start, opening + moves)
+            if word is None:
+                break
+            pos.make(next(move for move in pos.generate_moves() if move_text(move) == word))
+            moves.append(word)
+        played.append((opening, moves))
+    engine.close()
+    elapsed = time.perf_counter() - start_time
+    total = sum(len(moves) for _, moves in played)
+    metrics = {"protocol_moves_per_s": total / elapsed}
+
+    # The same positions, each asked of a process started just for it
+    lines = [opening + moves[:ply] for opening, moves in played for ply in range(len(moves))][:spawn_moves]
+    start_time = time.perf_counter()
+    for moves in lines:
+        engine = EngineProcess()
+        engine.best_move(start, moves)
+        engine.close()
+    metrics["spawn_moves_per_s"] = len(lines) / (time.perf_counter() - start_time)
+    return metrics
+
+
+def run(repeat):
+    metrics = {}
+    failures, perft_nodes = check_perft()
+    metrics["perft_nps"] = perft_nodes / best_time(check_perft, repeat)
+
+    positions = [Position.from_text(text) for _, text, _ in CORPUS]
+
+    def search_all():
+        nodes = 0
+        for pos in positions:
+            search = Search()
+            search.iterate(pos, SEARCH_DEPTH)
+            nodes += search.nodes
+        return nodes
+
+    search_nodes = search_all()
+    metrics["search_nodes"] = search_nodes
+    metrics["search_nps"] = search_nodes / best_time(search_all, repeat)
+
+    # Cold ai_move latency, best of `repeat` per position: a fresh engine per
+    # move, as a new game would have
+    latencies = []
+    for pos in positions:
+        latencies.append(best_time(lambda: Engine().choose_move(pos), repeat))
+    metrics["ai_move_mean_ms"] = statistics.mean(latencies) * 1000
+    metrics["ai_move_max_ms"] = max(latencies) * 1000
+
+    def evaluate_all():
+        for _ in range(1000):
+            for pos in positions:
+                pos.evaluate()
+
+    metrics["eval_per_s"] = 1000 * len(positions) / best_time(evaluate_all, repeat)
+
+    tracemalloc.start()
+    Engine(max_depth=SEARCH_DEPTH).choose_move(positions[0])
+    metrics["peak_memory_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return metrics, failures
+
+
+def compare(metrics, baseline, threshold):
+    regressions = []
+    for name, old in baseline["metrics"].items():
+        new = metrics.get(name)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if worse > threshold:
+            regressions.append(f"{name}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless perft and search benchmarks.")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per metric; the best is kept")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--ponder", action="store_true",
+                        help="also measure move latency with pondering against a simulated opponent")
+    parser.add_argument("--sizes", action="store_true",
+                        help=f"also measure perft and search speed from the start on "
+                             f"{BOARD_SIZES[0]}x{BOARD_SIZES[0]} to {BOARD_SIZES[-1]}x{BOARD_SIZES[-1]} boards")
+    parser.add_argument("--protocol", action="store_true",
+                        help="also measure self-play throughput over the text protocol against a process per move")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fractional slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    metrics, failures = run(args.repeat)
+    if args.ponder:
+        metrics.update(run_ponder(args.repeat))
+    if args.sizes:
+        metrics.update(run_sizes())
+    if args.protocol:
+        metrics.update(run_protocol())
+    result = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "metrics": metrics,
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    for failure in failures:
+        print(f"PERFT MISMATCH {failure}", file=sys.stderr)
+    status = 1 if failures else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(metrics, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+import time
+
+from engine import Position, Search, TranspositionTable, decode_move, encode_move, move_text
+
+MAGIC = b"HXBK"
+VERSION = 1
+# magic, version, plies, entries, search depth, hash of the start position
+HEADER = struct.Struct("<4sHHIIQ")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hexapawn.book")
+DEFAULT_PLIES = 8
+DEFAULT_DEPTH = 12
+
+
+def openings(plies, root=None):
+    # Every unfinished position with a legal move within `plies` plies of root
+    if root is None:
+        root = Position.initial()
+    found = {}
+    stack = [(root.copy(), 0)]
+    while stack:
+        pos, ply = stack.pop()
+        if pos.hash in found or pos.winner() is not None:
+            continue
+        moves = pos.generate_moves()
+        if not moves:
+            continue
+        found[pos.hash] = pos
+        if ply < plies:
+            for move in moves:
+                child = pos.copy()
+                child.make(move)
+                stack.append((child, ply + 1))
+    return found
+
+
+def build(plies=DEFAULT_PLIES, depth=DEFAULT_DEPTH, tt_size_mb=16):
+    # Best move by a depth-`depth` search for every opening position, keyed by hash
+    tt = TranspositionTable(tt_size_mb)
+    book = {}
+    for key, pos in openings(plies).items():
+        move, _ = Search(tt).iterate(pos, depth)
+        if move is not None:
+            book[key] = move
+    return book
+
+
+def write(path, book, plies, depth):
+    keys = sorted(book)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, plies, len(keys), depth, Position.initial().hash))
+        f.write(struct.pack(f"<{len(keys)}Q", *keys))
+        f.write(struct.pack(f"<{len(keys)}H", *(encode_move(book[key]) for key in keys)))
+
+
+class Book:
+    # Sorted keys and packed moves, mapped on the first probe so creating a
+    # Book costs nothing until a game asks it for a move
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.keys = None
+        self.moves = None
+
+    @classmethod
+    def load_default(cls):
+        # The book is optional; callers fall back to search without it
+        if not os.path.exists(DEFAULT_PATH):
+            return None
+        return cls(DEFAULT_PATH)
+
+    def open(self):
+        if self.map is not None:
+            return self
+        self.file = open(self.path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.plies, self.size, self.depth, start_hash = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} opening book")
+        if start_hash != Position.initial().hash:
+            self.close()
+            raise ValueError(f"{self.path} was built with different Zobrist keys or rules")
+        view = memoryview(self.map)
+        offset = HEADER.size
+        self.keys = view[offset:offset + 8 * self.size].cast("Q")
+        offset += 8 * self.size
+        self.moves = view[offset:offset + 2 * self.size].cast("H")
+        return self
+
+    def close(self):
+        for view in (self.keys, self.moves):
+            if view is not None:
+                view.release()
+        if self.map is not None:
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+        self.file = self.map = self.keys = self.moves = None
+
+    def __len__(self):
+        return len(self.open().keys)
+
+    def probe(self, pos):
+        # The book move for pos, or None when pos is not in the book
+        self.open()
+        key = pos.hash
+        index = bisect.bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return None
+        move = decode_move(self.moves[index])
+        # Guard against a hash collision with a position outside the book
+        if move not in pos.generate_moves():
+            return None
+        return move
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the opening book.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="search every position near the start and write the book")
+    build_parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="how far from the start to cover")
+    build_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="search depth per position")
+    build_parser.add_argument("-o", "--output", default=DEFAULT_PATH)
+    stats = sub.add_parser("stats", help="summarize a book file")
+    stats.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start_time = time.time()
+        book = build(args.plies, args.depth)
+        write(args.output, book, args.plies, args.depth)
+        print(f"Searched {len(book)} positions to depth {args.depth} in {time.time() - start_time:.2f} seconds, "
+              f"wrote {os.path.getsize(args.output)} bytes to {args.output}")
+    elif args.command == "stats":
+        book = Book(args.path).open()
+        move = book.probe(Position.initial())
+        print(f"{len(book)} positions within {book.plies} plies, searched to depth {book.depth}; "
+              f"start move {move_text(move) if move else None}")
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
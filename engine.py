@@ -0,0 +1,1249 @@
+import json
+import os
+import random
+import threading
+import time
+
+# Sides and move kinds
+WHITE, BLACK = 0, 1
+MOVE, CAPTURE, PUSH = 0, 1, 2
+MOVE_NAMES = ("move", "capture", "push")
+
+# Evaluation weights, always in this order: pawn and blocker values, per
+# row a pawn has advanced, per piece on a center square, per legal move,
+# and per piece on the opponent's back row
+WEIGHT_NAMES = ("pawns", "blockers", "advancement", "center", "mobility", "back_row")
+DEFAULT_WEIGHTS = (1, 2, 0.1, 0.2, 0.15, 0.3)
+DEFAULT_WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights.json")
+
+# Zobrist seed; a fixed seed keeps hashes stable across processes
+ZOBRIST_SEED = 0x4E58
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Scores, black minus white like evaluate(). A win for black found `ply`
+# plies from the root scores MATE - ply and a win for white -(MATE - ply),
+# so a faster win scores higher. Anything beyond MATE_BOUND is a proven
+# result; INFINITE only opens search windows.
+MATE = 100000
+MATE_BOUND = MATE // 2
+INFINITE = MATE + 1
+DRAW = 0
+# Width of the null windows that test whether a move beats the best so far;
+# evaluations are floats, so any width above zero works
+NULL_WINDOW = 1e-9
+
+# Seconds between checks of a caller's stop while collecting a ponder search
+STOP_POLL = 0.01
+
+
+class Geometry:
+    # Board size and starting layout, with every table the engine derives
+    # from them. Squares are numbered row * cols + col from the top left;
+    # bitboards are plain ints, so any size works.
+    # Each side starts with `pawns` pawns centred on its back row. `blockers`
+    # lists the white blocker squares; black's are the point reflections.
+    # `weights` are the evaluation weights, in WEIGHT_NAMES order.
+    def __init__(self, rows=4, cols=4, pawns=None, blockers=None, weights=None):
+        if rows < 3 or cols < 2:
+            raise ValueError(f"a {rows}x{cols} board is too small")
+        self.rows = rows
+        self.cols = cols
+        self.squares = rows * cols
+        self.pawns = cols if pawns is None else pawns
+        if not 1 <= self.pawns <= cols:
+            raise ValueError(f"{self.pawns} pawns do not fit on {cols} files")
+        self.blockers = ((rows - 2, cols - 2),) if blockers is None else tuple(blockers)
+
+        self.top_row = (1 << cols) - 1
+        self.bottom_row = self.top_row << (self.squares - cols)
+        self.full = (1 << self.squares) - 1
+        left_file = 0
+        for row in range(rows):
+            left_file |= 1 << (row * cols)
+        self.not_left_file = self.full ^ left_file
+        self.not_right_file = self.full ^ (left_file << (cols - 1))
+        # Reaching this row wins, per side
+        self.promotion = (self.top_row, self.bottom_row)
+        # The middle two rows and files, or the middle one when odd
+        self.center = 0
+        for row in range((rows - 1) // 2, rows // 2 + 1):
+            for col in range((cols - 1) // 2, cols // 2 + 1):
+                self.center |= 1 << self.square(row, col)
+
+        first = (cols - self.pawns) // 2
+        files = sum(1 << col for col in range(first, first + self.pawns))
+        self.start_pawns = (files << (self.squares - cols), files)
+        start_blockers = [0, 0]
+        for row, col in self.blockers:
+            if not (0 < row < rows - 1 and 0 <= col < cols):
+                raise ValueError(f"blocker square {(row, col)} is off the board or on a back row")
+            for side, sq in ((WHITE, self.square(row, col)), (BLACK, self.squares - 1 - self.square(row, col))):
+                if (start_blockers[WHITE] | start_blockers[BLACK]) >> sq & 1:
+                    raise ValueError(f"blocker square {(row, col)} collides with another blocker")
+                start_blockers[side] |= 1 << sq
+        self.start_blockers = tuple(start_blockers)
+
+        self.weights = DEFAULT_WEIGHTS if weights is None else tuple(weights)
+        if len(self.weights) != len(WEIGHT_NAMES):
+            raise ValueError(f"expected {len(WEIGHT_NAMES)} weights, got {len(self.weights)}")
+        self.mobility_bonus = self.weights[WEIGHT_NAMES.index("mobility")]
+        self.pawn_value = self.weights[WEIGHT_NAMES.index("pawns")]
+        self.pawn_table, self.blocker_table = self._piece_square_tables()
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist_pawn = [[rng.getrandbits(64) for _ in range(self.squares)] for _ in (WHITE, BLACK)]
+        self.zobrist_blocker = [[rng.getrandbits(64) for _ in range(self.squares)] for _ in (WHITE, BLACK)]
+        self.zobrist_side = rng.getrandbits(64)
+        self.forward, self.captures, self.pushes = self._move_tables()
+        # Every move advances a pawn, so no game lasts longer than this many plies
+        self.max_plies = 2 * self.squares
+
+    def __repr__(self):
+        return f"Geometry({self.rows}, {self.cols}, pawns={self.pawns}, blockers={self.blockers})"
+
+    # Geometries built from the same arguments are interchangeable, e.g. two
+    # parsed from texts of one size
+    def _key(self):
+        return self.rows, self.cols, self.pawns, self.blockers, self.weights
+
+    def __eq__(self, other):
+        return isinstance(other, Geometry) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def with_weights(self, weights):
+        # The same board evaluated with other weights; Zobrist keys are unchanged
+        return Geometry(self.rows, self.cols, self.pawns, self.blockers, weights)
+
+    def square(self, row, col):
+        return row * self.cols + col
+
+    def _piece_square_tables(self):
+        # Everything in evaluate() except mobility depends only on one piece and
+        # its square, so it is summed from these tables, signed black minus white
+        rows = self.rows
+        pawn_value, blocker_value, advance_bonus, center_bonus, _, back_row_bonus = self.weights
+        pawn = ([0.0] * self.squares, [0.0] * self.squares)
+        blocker = ([0.0] * self.squares, [0.0] * self.squares)
+        for sq in range(self.squares):
+            row = sq // self.cols
+            center = center_bonus if self.center >> sq & 1 else 0
+            for side, sign, advance, back_row in ((WHITE, -1, rows - row, row == 0),
+                                                  (BLACK, 1, row, row == rows - 1)):
+                bonus = center + (back_row_bonus if back_row else 0)
+                pawn[side][sq] = sign * (pawn_value + advance * advance_bonus + bonus)
+                blocker[side][sq] = sign * (blocker_value + bonus)
+        return pawn, blocker
+
+    def _move_tables(self):
+        # Per side and square, prebuilt move tuples with the bits that enable them:
+        # the forward move, captures (left, right) and pushes (right, left)
+        rows, cols, squares = self.rows, self.cols, self.squares
+        forward = ([None] * squares, [None] * squares)
+        captures = ([()] * squares, [()] * squares)
+        pushes = ([()] * squares, [()] * squares)
+        for side, step in ((WHITE, -1), (BLACK, 1)):
+            for sq in range(squares):
+                row, col = divmod(sq, cols)
+                if not 0 <= row + step < rows:
+                    continue
+                ahead = sq + step * cols
+                forward[side][sq] = (sq, ahead, MOVE)
+                side_captures = []
+                side_pushes = []
+                if col > 0:
+                    side_captures.append((1 << (ahead - 1), (sq, ahead - 1, CAPTURE)))
+                if col < cols - 1:
+                    side_captures.append((1 << (ahead + 1), (sq, ahead + 1, CAPTURE)))
+                    side_pushes.append((1 << (sq + 1), 1 << (ahead + 1), (sq, ahead + 1, PUSH)))
+                if col > 0:
+                    side_pushes.append((1 << (sq - 1), 1 << (ahead - 1), (sq, ahead - 1, PUSH)))
+                captures[side][sq] = tuple(side_captures)
+                pushes[side][sq] = tuple(side_pushes)
+        return forward, captures, pushes
+
+
+# The standard 4x4 game; module-level names describe it
+DEFAULT = Geometry()
+ROWS, COLS, SQUARES = DEFAULT.rows, DEFAULT.cols, DEFAULT.squares
+
+
+def square(row, col):
+    return row * COLS + col
+
+
+def encode_move(move):
+    # (frm, to, kind) in 14 bits: six bits per square, so boards up to 8x8
+    frm, to, kind = move
+    return frm | to << 6 | kind << 12
+
+
+def decode_move(value):
+    return value & 0x3F, value >> 6 & 0x3F, value >> 12 & 0x3
+
+
+def load_weights(path=DEFAULT_WEIGHTS_PATH):
+    # {"weights": {name: value, ...}} as written by tune.py, in WEIGHT_NAMES order
+    with open(path) as f:
+        named = json.load(f)["weights"]
+    missing = [name for name in WEIGHT_NAMES if name not in named]
+    if missing:
+        raise ValueError(f"{path} has no weight for {', '.join(missing)}")
+    return tuple(float(named[name]) for name in WEIGHT_NAMES)
+
+
+def load_default_weights():
+    # Tuned weights when the file is present, otherwise None for the defaults
+    if not os.path.exists(DEFAULT_WEIGHTS_PATH):
+        return None
+    return load_weights(DEFAULT_WEIGHTS_PATH)
+
+
+def mate_distance(value):
+    # Plies from the root to a proven result, or None for a heuristic score
+    if value is None or abs(value) < MATE_BOUND:
+        return None
+    return MATE - abs(value)
+
+
+def score_to_tt(value, ply):
+    # Mate scores are stored as distances from the node rather than the root
+    if value >= MATE_BOUND:
+        return value + ply
+    if value <= -MATE_BOUND:
+        return value - ply
+    return value
+
+
+def score_from_tt(value, ply):
+    if value >= MATE_BOUND:
+        return value - ply
+    if value <= -MATE_BOUND:
+        return value + ply
+    return value
+
+
+def popcount(bb):
+    return bin(bb).count("1")
+
+
+def bits(bb):
+    # Yield set square indices, lowest first (row-major scan order)
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class Position:
+    # Bitboards per side: pawns[WHITE], pawns[BLACK], blockers[WHITE], blockers[BLACK]
+    def __init__(self, pawns=(0, 0), blockers=(0, 0), side=WHITE, geometry=None):
+        self.geometry = DEFAULT if geometry is None else geometry
+        self.pawns = list(pawns)
+        self.blockers = list(blockers)
+        self.side = side
+        self.hash = self.compute_hash()
+        # Kept up to date by make/unmake: static evaluation, pawn counts and
+        # the winner, with an undo stack of the previous (score, winner)
+        self.score = self.compute_score()
+        self.counts = [popcount(self.pawns[WHITE]), popcount(self.pawns[BLACK])]
+        self.result = self.compute_winner()
+        self.undo = []
+
+    def compute_score(self):
+        geometry = self.geometry
+        score = 0
+        for side in (WHITE, BLACK):
+            for sq in bits(self.pawns[side]):
+                score += geometry.pawn_table[side][sq]
+            for sq in bits(self.blockers[side]):
+                score += geometry.blocker_table[side][sq]
+        return score
+
+    def compute_winner(self):
+        if self.pawns[WHITE] & self.geometry.top_row:
+            return WHITE
+        if self.pawns[BLACK] & self.geometry.bottom_row:
+            return BLACK
+        if not self.pawns[WHITE]:
+            return BLACK
+        if not self.pawns[BLACK]:
+            return WHITE
+        return None
+
+    def compute_hash(self):
+        geometry = self.geometry
+        h = geometry.zobrist_side if self.side == BLACK else 0
+        for side in (WHITE, BLACK):
+            for sq in bits(self.pawns[side]):
+                h ^= geometry.zobrist_pawn[side][sq]
+            for sq in bits(self.blockers[side]):
+                h ^= geometry.zobrist_blocker[side][sq]
+        return h
+
+    @classmethod
+    def initial(cls, geometry=None):
+        geometry = DEFAULT if geometry is None else geometry
+        return cls(geometry.start_pawns, geometry.start_blockers, WHITE, geometry)
+
+    @classmethod
+    def from_text(cls, text, geometry=None):
+        # Rows from the top separated by "/", then the side to move:
+        # "bbbb/.B../..W./wwww w" is the start position. The board size comes
+        # from the text unless a geometry is given. Raises ValueError for
+        # anything else; with every row the board's width, no two pieces can
+        # share a square.
+        fields = text.split()
+        if len(fields) != 2 or fields[1] not in ("w", "b"):
+            raise ValueError(f"expected rows and a side w or b, got {text!r}")
+        rows = fields[0].split("/")
+        if geometry is None:
+            geometry = DEFAULT if (len(rows), len(rows[0])) == (ROWS, COLS) else Geometry(len(rows), len(rows[0]))
+        if len(rows) != geometry.rows or any(len(line) != geometry.cols for line in rows):
+            raise ValueError(f"expected {geometry.rows} rows of {geometry.cols} squares, got {text!r}")
+        pawns, blockers = [0, 0], [0, 0]
+        for row, line in enumerate(rows):
+            for col, char in enumerate(line):
+                bit = 1 << geometry.square(row, col)
+                if char == "w":
+                    pawns[WHITE] |= bit
+                elif char == "b":
+                    pawns[BLACK] |= bit
+                elif char == "W":
+                    blockers[WHITE] |= bit
+                elif char == "B":
+                    blockers[BLACK] |= bit
+                elif char != ".":
+                    raise ValueError(f"unknown piece {char!r} in {text!r}")
+        return cls(pawns, blockers, WHITE if fields[1] == "w" else BLACK, geometry)
+
+    def to_text(self):
+        rows = []
+        for row in range(self.geometry.rows):
+            line = ""
+            for col in range(self.geometry.cols):
+                piece = self.piece_at(self.geometry.square(row, col))
+                if piece is None:
+                    line += "."
+                else:
+                    side, is_blocker = piece
+                    line += ("W" if side == WHITE else "B") if is_blocker else ("w" if side == WHITE else "b")
+            rows.append(line)
+        return "/".join(rows) + (" w" if self.side == WHITE else " b")
+
+    def copy(self):
+        # The undo stack is not copied, so a copy cannot unmake past this point
+        pos = Position.__new__(Position)
+        pos.geometry = self.geometry
+        pos.pawns = self.pawns[:]
+        pos.blockers = self.blockers[:]
+        pos.side = self.side
+        pos.hash = self.hash
+        pos.score = self.score
+        pos.counts = self.counts[:]
+        pos.result = self.result
+        pos.undo = []
+        return pos
+
+    def occupied(self):
+        return self.pawns[0] | self.pawns[1] | self.blockers[0] | self.blockers[1]
+
+    def piece_at(self, sq):
+        # Returns (side, is_blocker) or None for an empty square
+        bit = 1 << sq
+        for side in (WHITE, BLACK):
+            if self.pawns[side] & bit:
+                return side, False
+            if self.blockers[side] & bit:
+                return side, True
+        return None
+
+    def piece_moves(self, sq, side):
+        return [move for move in self.generate_moves(side) if move[0] == sq]
+
+    def generate_moves(self, side=None):
+        # All legal moves for one side, piece by piece in square order
+        if side is None:
+            side = self.side
+        other = side ^ 1
+        own = self.pawns[side]
+        enemy = self.pawns[other]
+        enemy_blockers = self.blockers[other]
+        occupied = own | enemy | self.blockers[side] | enemy_blockers
+        geometry = self.geometry
+        forward = geometry.forward[side]
+        captures = geometry.captures[side]
+        pushes = geometry.pushes[side]
+        moves = []
+        bb = own
+        while bb:
+            low = bb & -bb
+            bb ^= low
+            sq = low.bit_length() - 1
+            move = forward[sq]
+            if move is None:
+                continue  # Already on the last row
+            if not occupied >> move[1] & 1:
+                moves.append(move)
+            for target, move in captures[sq]:
+                if enemy & target:
+                    moves.append(move)
+            for ally, target, move in pushes[sq]:
+                if own & ally and enemy_blockers & target:
+                    moves.append(move)
+        return moves
+
+    def count_moves(self, side):
+        # Set-wise move count, for mobility: one shift per move kind
+        other = side ^ 1
+        own = self.pawns[side]
+        enemy = self.pawns[other]
+        enemy_blockers = self.blockers[other]
+        geometry = self.geometry
+        cols = geometry.cols
+        not_left = geometry.not_left_file
+        not_right = geometry.not_right_file
+        empty = geometry.full & ~(own | enemy | self.blockers[side] | enemy_blockers)
+        left = own & not_left
+        right = own & not_right
+        # Pawns with an allied pawn beside them, toward the pushed blocker
+        right_ally = own & (own >> 1) & not_right
+        left_ally = own & (own << 1) & not_left
+        if side == WHITE:
+            targets = (((own >> cols) & empty, (left >> (cols + 1)) & enemy, (right >> (cols - 1)) & enemy,
+                        (right_ally >> (cols - 1)) & enemy_blockers, (left_ally >> (cols + 1)) & enemy_blockers))
+        else:
+            targets = (((own << cols) & empty, (left << (cols - 1)) & enemy, (right << (cols + 1)) & enemy,
+                        (right_ally << (cols + 1)) & enemy_blockers, (left_ally << (cols - 1)) & enemy_blockers))
+        return sum(popcount(bb) for bb in targets)
+
+    def make(self, move):
+        frm, to, kind = move
+        side = self.side
+        other = side ^ 1
+        self.undo.append((self.score, self.result))
+        self.pawns[side] ^= (1 << frm) | (1 << to)
+        geometry = self.geometry
+        zobrist = geometry.zobrist_pawn
+        h = self.hash ^ geometry.zobrist_side ^ zobrist[side][frm] ^ zobrist[side][to]
+        table = geometry.pawn_table[side]
+        score = self.score + table[to] - table[frm]
+        if kind == CAPTURE:
+            self.pawns[other] ^= 1 << to
+            h ^= zobrist[other][to]
+            score -= geometry.pawn_table[other][to]
+            self.counts[other] -= 1
+        elif kind == PUSH:
+            self.blockers[other] ^= 1 << to
+            h ^= geometry.zobrist_blocker[other][to]
+            score -= geometry.blocker_table[other][to]
+        self.hash = h
+        self.score = score
+        # Only the side that just moved can have won
+        if geometry.promotion[side] >> to & 1:
+            self.result = side
+        elif not self.counts[other]:
+            self.result = side
+        self.side = other
+
+    def unmake(self, move):
+        frm, to, kind = move
+        side = self.side ^ 1
+        other = self.side
+        self.side = side
+        self.pawns[side] ^= (1 << frm) | (1 << to)
+        geometry = self.geometry
+        zobrist = geometry.zobrist_pawn
+        h = self.hash ^ geometry.zobrist_side ^ zobrist[side][frm] ^ zobrist[side][to]
+        if kind == CAPTURE:
+            self.pawns[other] ^= 1 << to
+            h ^= zobrist[other][to]
+            self.counts[other] += 1
+        elif kind == PUSH:
+            self.blockers[other] ^= 1 << to
+            h ^= geometry.zobrist_blocker[other][to]
+        self.hash = h
+        self.score, self.result = self.undo.pop()
+
+    def winner(self):
+        return self.result
+
+    def has_legal_moves(self, side):
+        return self.count_moves(side) > 0
+
+    def outcome(self):
+        # (over, winner) under the GUI's end rules: a win ends the game, and a
+        # side to move with no legal move has drawn, with winner None
+        winner = self.result
+        if winner is not None:
+            return True, winner
+        return not self.has_legal_moves(self.side), None
+
+    def evaluate(self):
+        # Black minus white: the incremental piece-square score plus mobility
+        mobility = self.count_moves(BLACK) - self.count_moves(WHITE)
+        return self.score + mobility * self.geometry.mobility_bonus
+
+
+def perft(pos, depth):
+    # Leaf count of the legal move tree; finished games are not expanded
+    if depth == 0:
+        return 1
+    if pos.winner() is not None:
+        return 0
+    moves = pos.generate_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        pos.make(move)
+        nodes += perft(pos, depth - 1)
+        pos.unmake(move)
+    return nodes
+
+
+class TranspositionTable:
+    # Rough size of one stored entry (tuple, key and score objects) in bytes
+    ENTRY_BYTES = 200
+
+    def __init__(self, size_mb=16):
+        slots = 1
+        while slots * 2 * self.ENTRY_BYTES <= size_mb * 1024 * 1024:
+            slots *= 2
+        self.mask = slots - 1
+        self.table = [None] * slots
+        self.age = 0
+
+    def new_search(self):
+        self.age += 1
+
+    def clear(self):
+        self.table = [None] * len(self.table)
+        self.age = 0
+
+    def probe(self, key):
+        # Returns (key, depth, score, flag, move, age) or None
+        entry = self.table[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        index = key & self.mask
+        old = self.table[index]
+        # Depth-preferred replacement, but entries from older searches always yield
+        if old is None or old[0] == key or old[5] != self.age or depth >= old[1]:
+            self.table[index] = (key, depth, score, flag, move, self.age)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    # Counters for one search. Only a Search given a stats object fills them
+    # in, so an uninstrumented search pays a single None check per node.
+    def __init__(self):
+        self.source = "search"
+        # Whether a ponder search had already found the move, from any source
+        self.ponder_hit = False
+        self.geometry = None
+        self.move = None
+        self.value = None
+        self.nodes = 0
+        self.leaf_evaluations = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        # Null-window and aspiration searches that had to be repeated with a wider window
+        self.researches = 0
+        self.depth = None
+        self.pv = []
+        # Nodes searched by each completed iteration, shallowest first
+        self.iteration_nodes = []
+        self.movegen_time = 0.0
+        self.eval_time = 0.0
+        self.elapsed = 0.0
+        # How long choose_move kept its caller waiting; below elapsed after a ponder hit
+        self.latency = 0.0
+
+    @property
+    def first_move_cutoff_rate(self):
+        # Share of cutoffs caused by the first move tried; near 1 means good ordering
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else None
+
+    @property
+    def branching_factor(self):
+        # Effective branching factor: growth in nodes between the last two iterations
+        counts = self.iteration_nodes
+        if len(counts) < 2 or not counts[-2]:
+            return None
+        return counts[-1] / counts[-2]
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed else None
+
+    def as_dict(self):
+        return {
+            "source": self.source,
+            "ponder_hit": self.ponder_hit,
+            "move": self.move,
+            "value": self.value,
+            "nodes": self.nodes,
+            "leaf_evaluations": self.leaf_evaluations,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate,
+            "researches": self.researches,
+            "branching_factor": self.branching_factor,
+            "depth": self.depth,
+            "pv": self.pv,
+            "iteration_nodes": self.iteration_nodes,
+            "movegen_time": self.movegen_time,
+            "eval_time": self.eval_time,
+            "elapsed": self.elapsed,
+            "latency": self.latency,
+        }
+
+    def summary(self):
+        prefix = f"ponder hit, waited {self.latency * 1000:.2f} ms: " if self.ponder_hit else ""
+        if self.source != "search":
+            move = "none" if self.move is None else move_text(self.move, self.geometry)
+            return prefix + f"{self.source}: move {move} in {self.elapsed * 1000:.2f} ms"
+        rate = self.first_move_cutoff_rate
+        ebf = self.branching_factor
+        return (prefix + f"depth {self.depth}, {self.nodes} nodes in {self.elapsed * 1000:.2f} ms, "
+                f"{self.leaf_evaluations} evals, {self.cutoffs} cutoffs "
+                f"({'-' if rate is None else f'{rate:.0%}'} first move), {self.researches} re-searches, "
+                f"EBF {'-' if ebf is None else f'{ebf:.2f}'}, "
+                f"movegen {self.movegen_time * 1000:.2f} ms, eval {self.eval_time * 1000:.2f} ms, "
+                f"pv {' '.join(move_text(move, self.geometry) for move in self.pv)}")
+
+
+def move_text(move, geometry=None):
+    # (frm, to, kind) -> "a1-a2", "a1xb2" or "a1>b2", files from the left and ranks from the bottom
+    geometry = DEFAULT if geometry is None else geometry
+    frm, to, kind = move
+    names = [f"{chr(97 + sq % geometry.cols)}{geometry.rows - sq // geometry.cols}" for sq in (frm, to)]
+    return names[0] + "-x>"[kind] + names[1]
+
+
+def tactical_moves(pos, moves):
+    # The captures, pushes and moves onto the last row among moves, winning
+    # advances first since nothing beats them
+    promotion = pos.geometry.promotion[pos.side]
+    wins = [move for move in moves if promotion >> move[1] & 1]
+    return wins + [move for move in moves if move[2] != MOVE and not promotion >> move[1] & 1]
+
+
+class Search:
+    # How many nodes pass between clock checks
+    CHECK_EVERY = 256
+    # Half-width of the aspiration window around the previous iteration's
+    # score, in pawns of the board's weights, or None for full windows. On
+    # these small trees a window has saved at most 0.3% of the nodes and
+    # cost up to 3%, so it is off.
+    ASPIRATION = None
+    # Null-window scouting from this remaining depth up; nearer the leaves
+    # the re-searches cost more than the scouts save
+    PVS_DEPTH = 6
+
+    def __init__(self, tt=None, time_limit=None, node_limit=None, leaf_evaluator=None, stats=None,
+                 stop=None, quiescence=True):
+        self.tt = tt
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        # Optional threading.Event; once set the search ends like a timeout
+        self.stop = stop
+        # Optional batch scorer for depth-1 children, e.g. vectorized.evaluate_bitboards;
+        # called with their packed bitboards and geometry=the board they are on
+        self.leaf_evaluator = leaf_evaluator
+        # Optional SearchStats to fill in; None keeps the search uninstrumented
+        self.stats = stats
+        # Resolve captures, pushes and winning advances past the horizon
+        self.quiescence = quiescence
+        self.deadline = None
+        self.nodes = 0
+        # Two quiet moves per ply that caused a beta cutoff
+        self.killers = {}
+        # Cutoff counts per (side, move), weighted by remaining depth
+        self.history = {}
+
+    def order_moves(self, moves, side, tt_move, ply):
+        killers = self.killers.get(ply, ())
+        history = self.history
+
+        def score(move):
+            if move == tt_move:
+                return 1 << 30
+            if move[2] != MOVE:
+                return 1 << 29  # Captures and pushes first
+            if move in killers:
+                return (1 << 28) - killers.index(move)
+            return history.get((side, move), 0)
+
+        # sort is stable, so ties keep the generation order
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def record_cutoff(self, move, side, depth, ply):
+        if move[2] != MOVE:
+            return
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        key = (side, move)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def check_budget(self):
+        if self.stop is not None and self.stop.is_set():
+            raise SearchTimeout
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout
+
+    def minimax(self, pos, depth, maximizing_player, alpha, beta, ply=0):
+        # Black-minus-white score of pos within (alpha, beta); maximizing_player
+        # is whether black is to move. The search itself is negamax.
+        if maximizing_player:
+            return self.negamax(pos, depth, alpha, beta, ply)
+        return -self.negamax(pos, depth, -beta, -alpha, ply)
+
+    def negamax(self, pos, depth, alpha, beta, ply=0):
+        # Score of pos for the side to move, searched with principal
+        # variation search: the first move gets the full window, the rest a
+        # null window that only asks whether they beat it
+        if depth == 0 and self.quiescence:
+            return self.quiesce(pos, alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes % self.CHECK_EVERY == 0:
+            self.check_budget()
+
+        # Base cases
+        winner = pos.winner()
+        if winner is not None:
+            return MATE - ply if winner == pos.side else ply - MATE
+        stats = self.stats
+        if depth == 0:
+            return self.static_score(pos)
+        # No line from here can beat a win on the next ply, so a window
+        # already past that is decided
+        bound = MATE - ply - 1
+        if alpha >= bound:
+            return bound
+        if beta <= -bound:
+            return -bound
+
+        tt = self.tt
+        tt_move = None
+        if tt is not None:
+            entry = tt.probe(pos.hash)
+            if entry is not None:
+                tt_move = entry[4]
+                if entry[1] >= depth:
+                    score, flag = score_from_tt(entry[2], ply), entry[3]
+                    if flag == EXACT:
+                        return score
+                    if flag == LOWER:
+                        alpha = max(alpha, score)
+                    else:
+                        beta = min(beta, score)
+                    if beta <= alpha:
+                        return score
+
+        moves = self.generate_moves(pos)
+        if not moves:
+            # The side to move is stuck, which draws
+            return DRAW
+        side = pos.side
+        if depth == 1 and self.leaf_evaluator is not None:
+            value, best = self.evaluate_children(pos, moves, ply)
+            if tt is not None:
+                tt.store(pos.hash, depth, score_to_tt(value, ply), EXACT, best)
+            return value
+        self.order_moves(moves, side, tt_move, ply)
+
+        alpha_orig = alpha
+        value = -INFINITE
+        best = None
+        for move in moves:
+            pos.make(move)
+            if best is None or depth < self.PVS_DEPTH:
+                score = -self.negamax(pos, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(pos, depth - 1, -alpha - NULL_WINDOW, -alpha, ply + 1)
+                if alpha < score < beta:
+                    if stats is not None:
+                        stats.researches += 1
+                    score = -self.negamax(pos, depth - 1, -beta, -alpha, ply + 1)
+            pos.unmake(move)
+            if score > value or best is None:
+                value = score
+                best = move
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.record_cutoff(move, side, depth, ply)
+                if stats is not None:
+                    stats.cutoffs += 1
+                    stats.first_move_cutoffs += move is moves[0]
+                break
+
+        if tt is not None:
+            if value <= alpha_orig:
+                flag = UPPER
+            elif value >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+            tt.store(pos.hash, depth, score_to_tt(value, ply), flag, best)
+        return value
+
+    def quiesce(self, pos, alpha, beta, ply):
+        # Past the horizon only captures, pushes and moves onto the last row
+        # are searched; the side to move may also stand on the static score
+        self.nodes += 1
+        if self.nodes % self.CHECK_EVERY == 0:
+            self.check_budget()
+        winner = pos.winner()
+        if winner is not None:
+            return MATE - ply if winner == pos.side else ply - MATE
+        moves = self.generate_moves(pos)
+        if not moves:
+            return DRAW
+        value = self.static_score(pos)
+        if value >= beta:
+            return value
+        alpha = max(alpha, value)
+        for move in tactical_moves(pos, moves):
+            pos.make(move)
+            score = -self.quiesce(pos, -beta, -alpha, ply + 1)
+            pos.unmake(move)
+            value = max(value, score)
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+        return value
+
+    def generate_moves(self, pos):
+        # pos.generate_moves(), timed when the search is instrumented
+        stats = self.stats
+        if stats is None:
+            return pos.generate_moves()
+        start_time = time.perf_counter()
+        moves = pos.generate_moves()
+        stats.movegen_time += time.perf_counter() - start_time
+        return moves
+
+    def unsettled(self, pos):
+        # Whether quiescence would see more than the static score: the side
+        # to move is stuck or has a capture, push or win to play
+        moves = self.generate_moves(pos)
+        return not moves or bool(tactical_moves(pos, moves))
+
+    def static_score(self, pos):
+        # evaluate() from the side to move's point of view
+        if self.stats is not None:
+            value = self.timed_evaluate(pos)
+        else:
+            value = pos.evaluate()
+        return value if pos.side == BLACK else -value
+
+    def timed_evaluate(self, pos):
+        stats = self.stats
+        start_time = time.perf_counter()
+        value = pos.evaluate()
+        stats.eval_time += time.perf_counter() - start_time
+        stats.leaf_evaluations += 1
+        return value
+
+    def evaluate_children(self, pos, moves, ply=0):
+        # Score every quiet child of a depth-1 node with one leaf_evaluator
+        # call; children with a capture, push or win to play are quiesced.
+        # Scores are for the side to move in pos.
+        sign = 1 if pos.side == BLACK else -1
+        scores = [None] * len(moves)
+        pending = []
+        for i, move in enumerate(moves):
+            pos.make(move)
+            winner = pos.winner()
+            if winner is not None:
+                self.nodes += 1
+                scores[i] = MATE - ply - 1 if winner != pos.side else ply + 1 - MATE
+            elif self.quiescence and self.unsettled(pos):
+                scores[i] = -self.quiesce(pos, -INFINITE, INFINITE, ply + 1)
+            else:
+                self.nodes += 1
+                pending.append(i)
+                scores[i] = (pos.pawns[WHITE], pos.pawns[BLACK], pos.blockers[WHITE], pos.blockers[BLACK])
+            pos.unmake(move)
+        if pending:
+            stats = self.stats
+            if stats is not None:
+                start_time = time.perf_counter()
+            values = self.leaf_evaluator([scores[i] for i in pending], geometry=pos.geometry)
+            if stats is not None:
+                stats.eval_time += time.perf_counter() - start_time
+                stats.leaf_evaluations += len(pending)
+            for i, value in zip(pending, values):
+                scores[i] = sign * value
+        best = max(range(len(moves)), key=scores.__getitem__)
+        return scores[best], moves[best]
+
+    def root(self, pos, depth, pv_move=None, alpha=-INFINITE, beta=INFINITE):
+        # One iteration, scored for the side to move. Children are searched
+        # to `depth`, so the iteration spans depth + 1 plies. A result at or
+        # outside the window is only a bound, and then nothing is stored.
+        moves = self.order_moves(self.generate_moves(pos), pos.side, pv_move, 0)
+        stats = self.stats
+        alpha_orig = alpha
+        best = None
+        best_value = -INFINITE
+        for move in moves:
+            pos.make(move)
+            if best is None or depth + 1 < self.PVS_DEPTH:
+                value = -self.negamax(pos, depth, -beta, -alpha, 1)
+            else:
+                value = -self.negamax(pos, depth, -alpha - NULL_WINDOW, -alpha, 1)
+                if alpha < value < beta:
+                    if stats is not None:
+                        stats.researches += 1
+                    value = -self.negamax(pos, depth, -beta, -alpha, 1)
+            pos.unmake(move)
+            if best is None or value > best_value:
+                best_value = value
+                best = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        if self.tt is not None and best is not None and alpha_orig < best_value < beta:
+            self.tt.store(pos.hash, depth + 1, score_to_tt(best_value, 0), EXACT, best)
+        return best, best_value
+
+    def aspirate(self, pos, depth, pv_move, guess):
+        # root() in a narrow window around the last iteration's score,
+        # opening the side it fails on until the score lands inside
+        if self.ASPIRATION is None or guess is None or mate_distance(guess) is not None:
+            return self.root(pos, depth, pv_move)
+        width = self.ASPIRATION * pos.geometry.pawn_value
+        alpha, beta = guess - width, guess + width
+        while True:
+            move, value = self.root(pos, depth, pv_move, alpha, beta)
+            if alpha < value < beta or move is None:
+                return move, value
+            if self.stats is not None:
+                self.stats.researches += 1
+            if value <= alpha:
+                alpha = -INFINITE
+            else:
+                beta = INFINITE
+            pv_move = move
+
+    def iterate(self, pos, max_depth=None):
+        # Iterative deepening; returns the best move of the deepest completed
+        # iteration and its score, black minus white
+        if max_depth is None:
+            max_depth = pos.geometry.max_plies
+        start_time = time.perf_counter()
+        if self.time_limit is not None:
+            self.deadline = start_time + self.time_limit
+        if self.tt is not None:
+            self.tt.new_search()
+        # A timeout unwinds mid-move, so search a copy and leave pos untouched
+        work = pos.copy()
+        best, best_value = None, None
+        stats = self.stats
+        for depth in range(max_depth + 1):
+            nodes = self.nodes
+            try:
+                move, value = self.aspirate(work, depth, best, best_value)
+            except SearchTimeout:
+                work = pos.copy()
+                break
+            if move is None:
+                break
+            best, best_value = move, value
+            if stats is not None:
+                stats.depth = depth
+                stats.iteration_nodes.append(self.nodes - nodes)
+            # A result proven within the plies searched needs no deeper look;
+            # one seen only through quiescence may still come sooner
+            distance = mate_distance(value)
+            if distance is not None and distance <= depth + 1:
+                break
+        if best is None:
+            # Out of budget before the first iteration finished
+            moves = self.order_moves(work.generate_moves(), work.side, None, 0)
+            if moves:
+                best = moves[0]
+        if best_value is not None and pos.side == WHITE:
+            best_value = -best_value
+        if stats is not None:
+            stats.geometry = pos.geometry
+            stats.move, stats.value = best, best_value
+            stats.nodes = self.nodes
+            # An iteration at depth d spans d + 1 plies
+            stats.pv = self.principal_variation(work, best, 1 if stats.depth is None else stats.depth + 1)
+            stats.elapsed = time.perf_counter() - start_time
+        return best, best_value
+
+    def principal_variation(self, pos, first, length):
+        # The best move followed by the replies stored in the table
+        pv = []
+        move = first
+        pos = pos.copy()
+        while move is not None and len(pv) < length:
+            pv.append(move)
+            pos.make(move)
+            if pos.winner() is not None or self.tt is None:
+                break
+            entry = self.tt.probe(pos.hash)
+            move = entry[4] if entry is not None else None
+            # A stale entry could hold a move that is illegal here
+            if move is not None and move not in pos.generate_moves():
+                break
+        return pv
+
+
+def minimax(pos, depth, maximizing_player, alpha, beta, tt=None):
+    return Search(tt).minimax(pos, depth, maximizing_player, alpha, beta)
+
+
+def best_move(pos, max_depth=4, tt=None, time_limit=None, node_limit=None, leaf_evaluator=None,
+              stats=None, stop=None):
+    # With no budget this is a fixed-depth search; a budget caps it earlier
+    return Search(tt, time_limit, node_limit, leaf_evaluator, stats, stop).iterate(pos, max_depth)
+
+
+class Engine:
+    # Move selection for one game: solved positions come from the tablebase,
+    # early ones from the opening book, everything else from an
+    # iterative-deepening search sharing one table.
+    # workers > 1 splits fixed-depth searches across a process pool.
+    # With instrument=True (implied by on_stats) every move leaves a
+    # SearchStats in self.stats and passes it to on_stats.
+    def __init__(self, max_depth=4, time_limit=None, tt=None, tablebase=None, workers=None,
+                 leaf_evaluator=None, instrument=False, on_stats=None, book=None, weights=None):
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.tablebase = tablebase
+        self.book = book
+        # Evaluation weights for the search, or None to keep each position's own,
+        # and the reweighted geometries by board
+        self.weights = None if weights is None else tuple(weights)
+        self.weighted = {}
+        self.workers = workers
+        self.leaf_evaluator = leaf_evaluator
+        self.instrument = instrument or on_stats is not None
+        self.on_stats = on_stats
+        self.stats = None
+        self.parallel = None
+        # Search running on the opponent's time: its handle, the position it
+        # searches and the stats it fills in
+        self.ponder_handle = None
+        self.ponder_hash = None
+        self.ponder_stats = None
+
+    def choose_move(self, pos, time_limit=None, stop=None, max_depth=None):
+        # max_depth caps this search, timed or not; without it a time budget
+        # lets the search go as deep as the clock allows
+        start_time = time.perf_counter()
+        move, stats = self._ponder_result(pos, stop)
+        if stats is None:
+            if not self.instrument:
+                return self._choose_move(pos, time_limit, None, stop, max_depth)
+            stats = SearchStats()
+            move = self._choose_move(pos, time_limit, stats, stop, max_depth)
+            if stats.source != "search":
+                stats.geometry = pos.geometry
+                stats.move = move
+                stats.elapsed = time.perf_counter() - start_time
+        if self.instrument:
+            stats.latency = time.perf_counter() - start_time
+            self.stats = stats
+            if self.on_stats is not None:
+                self.on_stats(stats)
+        return move
+
+    def reweigh(self, pos):
+        # pos on a geometry carrying self.weights, built once per board
+        geometry = self.weighted.get(pos.geometry)
+        if geometry is None:
+            geometry = self.weighted[pos.geometry] = pos.geometry.with_weights(self.weights)
+        return Position(pos.pawns, pos.blockers, pos.side, geometry)
+
+    def start_move(self, pos, time_limit=None):
+        # choose_move on a worker thread; poll the handle instead of blocking
+        return SearchHandle(self.choose_move, pos, time_limit)
+
+    def predict(self, pos):
+        # The move we expect from the side to move in pos: the tablebase's,
+        # the book's or the table's choice, else a shallow search
+        if self.tablebase is not None:
+            move = self.tablebase.best_move(pos)
+            if move is not None:
+                return move
+        if self.book is not None:
+            move = self.book.probe(pos)
+            if move is not None:
+                return move
+        moves = pos.generate_moves()
+        entry = self.tt.probe(pos.hash)
+        if entry is not None and entry[4] in moves:
+            return entry[4]
+        if not moves:
+            return None
+        # The shallow search shares self.tt, so it must score on the same weights
+        if self.weights is not None:
+            pos = self.reweigh(pos)
+        return Search(self.tt).iterate(pos, 2)[0]
+
+    def ponder(self, pos, time_limit=None):
+        # Call once the opponent is to move in pos. The reply to their
+        # predicted move is searched in the background; choose_move collects
+        # it if they play that move and cancels it otherwise. Both searches
+        # share self.tt, so a miss still starts from the ponder's entries.
+        self.stop_pondering()
+        if pos.winner() is not None:
+            return None
+        predicted = self.predict(pos)
+        if predicted is None:
+            return None
+        child = pos.copy()
+        child.make(predicted)
+        if child.outcome()[0]:
+            return None
+        stats = SearchStats() if self.instrument else None
+
+        def search(pos, time_limit, stop):
+            start_time = time.perf_counter()
+            move = self._choose_move(pos, time_limit, stats, stop)
+            if stats is not None and stats.source != "search":
+                stats.geometry = pos.geometry
+                stats.elapsed = time.perf_counter() - start_time
+            return move
+
+        self.ponder_stats = stats
+        self.ponder_hash = child.hash
+        self.ponder_handle = SearchHandle(search, child, time_limit)
+        return predicted
+
+    def stop_pondering(self):
+        if self.ponder_handle is not None:
+            self.ponder_handle.cancel()
+        self.ponder_handle = self.ponder_hash = self.ponder_stats = None
+
+    def _ponder_result(self, pos, stop=None):
+        # (move, stats) from a ponder search of pos, or (None, None) if none
+        # applies. Setting stop while it finishes cancels it instead.
+        if self.ponder_handle is None:
+            return None, None
+        if pos.hash != self.ponder_hash:
+            self.stop_pondering()
+            return None, None
+        handle, stats = self.ponder_handle, self.ponder_stats
+        self.ponder_handle = self.ponder_hash = self.ponder_stats = None
+        while not handle.wait(STOP_POLL):
+            if stop is not None and stop.is_set():
+                handle.cancel()
+                return None, None
+        move = handle.result()
+        if move is None:
+            return None, None
+        if stats is None:
+            stats = SearchStats()
+        stats.ponder_hit = True
+        stats.move = move
+        return move, stats
+
+    def _choose_move(self, pos, time_limit, stats, stop, max_depth=None):
+        if pos.winner() is not None:
+            return None
+        if self.tablebase is not None:
+            move = self.tablebase.best_move(pos)
+            if move is not None:
+                if stats is not None:
+                    stats.source = "tablebase"
+                return move
+        if self.book is not None:
+            move = self.book.probe(pos)
+            if move is not None:
+                if stats is not None:
+                    stats.source = "book"
+                return move
+        if self.weights is not None:
+            pos = self.reweigh(pos)
+        if time_limit is None:
+            time_limit = self.time_limit
+        # The process pool cannot be interrupted, so a stoppable search stays serial
+        if max_depth is None:
+            # A time budget lets the search go as deep as the clock allows
+            max_depth = self.max_depth if time_limit is None else None
+        if self.workers and self.workers > 1 and time_limit is None and stop is None:
+            if self.parallel is None:
+                # Imported here so the serial engine never pays for multiprocessing
+                from parallel import ParallelSearch
+                self.parallel = ParallelSearch(self.workers)
+            move, value = self.parallel.best_move(pos, max_depth)
+            if stats is not None:
+                # The workers keep their own counters; only the totals come back
+                stats.source = "parallel"
+                stats.value, stats.nodes, stats.depth = value, self.parallel.nodes, max_depth
+            return move
+        move, _ = best_move(pos, max_depth, self.tt, time_limit, leaf_evaluator=self.leaf_evaluator,
+                            stats=stats, stop=stop)
+        return move
+
+    def close(self):
+        self.stop_pondering()
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+
+class SearchHandle:
+    # One search, choose(pos, time_limit, stop) -> move, running on a daemon
+    # thread. The caller polls done() and collects result(); cancel() stops
+    # the search at its next budget check, within CHECK_EVERY nodes.
+    # Both threads share the GIL, so the caller keeps running but more slowly.
+    def __init__(self, choose, pos, time_limit=None):
+        self.stop = threading.Event()
+        self.move = None
+        self.error = None
+        # The caller may move on with its own position while this one is searched
+        self.thread = threading.Thread(target=self._run, args=(choose, pos.copy(), time_limit), daemon=True)
+        self.thread.start()
+
+    def _run(self, choose, pos, time_limit):
+        try:
+            self.move = choose(pos, time_limit, self.stop)
+        except Exception as exc:
+            self.error = exc
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        # True once the search has ended
+        self.thread.join(timeout)
+        return self.done()
+
+    def cancelled(self):
+        return self.stop.is_set()
+
+    def result(self, timeout=None):
+        # The chosen move, or None once cancelled
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            raise TimeoutError("search still running")
+        if self.error is not None:
+            raise self.error
+        return None if self.cancelled() else self.move
+
+    def cancel(self, wait=True):
+        self.stop.set()
+        if wait:
+            self.thread.join()
@@ -0,0 +1,123 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import BLACK, INFINITE, Position, Search, TranspositionTable, mate_distance
+
+def _search_moves(pos, depth, moves, alpha, beta, tt_size_mb):
+    # Score a slice of the root moves. Black maximizes, so a black root only
+    # needs values above alpha and a white root only values below beta.
+    search = Search(TranspositionTable(tt_size_mb) if tt_size_mb else None)
+    maximizing = pos.side == BLACK
+    values = []
+    for move in moves:
+        pos.make(move)
+        values.append(search.minimax(pos, depth, not maximizing, alpha, beta, 1))
+        pos.unmake(move)
+    return values, search.nodes
+
+
+class ParallelSearch:
+    # Root splitting over a process pool. The shallow iterations run here,
+    # exactly as Search.iterate would run them, so the last iteration sees the
+    # same root order. Its first move is searched here to set a bound, and the
+    # remaining moves are split across the workers with that bound.
+    # Every call starts from empty tables: entries left by deeper searches
+    # would change scores, and then the move could differ from the serial one.
+    def __init__(self, workers=None, tt_size_mb=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.tt_size_mb = tt_size_mb
+        self.pool = None
+        self.nodes = 0
+
+    def start(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        return self
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def best_move(self, pos, depth=4):
+        self.start()
+        pos = pos.copy()
+        search = Search(TranspositionTable(self.tt_size_mb) if self.tt_size_mb else None)
+        pv = None
+        if depth > 0:
+            pv, value = search.iterate(pos, depth - 1)
+            distance = mate_distance(value)
+            if distance is not None and distance <= depth:
+                # The serial search stops at a forced result as well
+                self.nodes = search.nodes
+                return pv, value
+        maximizing = pos.side == BLACK
+        moves = search.order_moves(pos.generate_moves(), pos.side, pv, 0)
+        if not moves:
+            return None, None
+
+        best = moves[0]
+        pos.make(best)
+        best_value = search.minimax(pos, depth, not maximizing, -INFINITE, INFINITE, 1)
+        pos.unmake(best)
+        self.nodes = search.nodes
+
+        rest = moves[1:]
+        if rest:
+            alpha, beta = (best_value, INFINITE) if maximizing else (-INFINITE, best_value)
+            chunks = [rest[i::self.workers] for i in range(min(self.workers, len(rest)))]
+            futures = [(chunk, self.pool.submit(_search_moves, pos, depth, chunk, alpha, beta, self.tt_size_mb))
+                       for chunk in chunks]
+            values = {}
+            for chunk, future in futures:
+                chunk_values, nodes = future.result()
+                self.nodes += nodes
+                values.update(zip(chunk, chunk_values))
+            # First strictly better move in root order, as the serial search picks
+            for move in rest:
+                value = values[move]
+                if (value > best_value) if maximizing else (value < best_value):
+                    best, best_value = move, value
+        return best, best_value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure parallel root-search speedup against worker count.")
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-tt", action="store_true", help="search without transposition tables")
+    args = parser.parse_args(argv)
+    tt_size_mb = 0 if args.no_tt else 16
+
+    pos = Position.initial()
+    start_time = time.perf_counter()
+    serial = Search(TranspositionTable(tt_size_mb) if tt_size_mb else None)
+    serial_move, serial_value = serial.iterate(pos, args.depth)
+    serial_time = time.perf_counter() - start_time
+    print(f"cores={os.cpu_count()} depth={args.depth} serial: {serial_time:.3f} s, "
+          f"{serial.nodes} nodes, move {serial_move}")
+
+    for workers in range(1, args.max_workers + 1):
+        with ParallelSearch(workers, tt_size_mb) as search:
+            # Warm the pool so process start-up is not timed
+            list(search.pool.map(abs, range(workers)))
+            start_time = time.perf_counter()
+            move, value = search.best_move(pos, args.depth)
+            elapsed = time.perf_counter() - start_time
+        same = "same move" if move == serial_move else "DIFFERENT move"
+        print(f"workers={workers}: {elapsed:.3f} s, speedup {serial_time / elapsed:.2f}x, "
+              f"{search.nodes} nodes, {same}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
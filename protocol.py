@@ -0,0 +1,304 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+
+from engine import (DEFAULT, Engine, Position, TranspositionTable, load_default_weights, mate_distance,
+                    move_text)
+
+NAME = "Hexapawn"
+
+# Engine options as (type, default, min, max), announced like UCI's "option" lines
+OPTIONS = {
+    "Depth": ("spin", 4, 1, 64),
+    "Hash": ("spin", 16, 1, 1024),
+    "OwnBook": ("check", True),
+    "Tablebase": ("check", True),
+}
+
+# A line-oriented protocol in the style of UCI. Commands, one per line:
+#   hxp                          identify; replies id/option lines, then hxpok
+#   isready                      replies readyok once any search has finished
+#   setoption name N value V     set one of OPTIONS
+#   newgame                      start a new game; the table is kept, since
+#                                games pass through the same early positions
+#   position startpos|text ROWS SIDE [moves M ...]
+#                                set the position, e.g. "text bbbb/.B../..W./wwww w"
+#                                and moves as "a1-a2", "b1xc2" or "b2>b3"
+#   go [depth N] [movetime MS] [infinite]
+#                                search in the background; replies info lines
+#                                once the search ends, then "bestmove M", or
+#                                just "bestmove none" when the game is over.
+#                                Given both a depth and a time, the search
+#                                ends at whichever limit comes first. Unlike
+#                                UCI, "infinite" only lifts the depth cap to
+#                                the longest possible game: a search that gets
+#                                there, which solves the position, replies
+#                                bestmove without waiting for stop
+#   stop                         end the search with the best move found so far
+#   show                         print the current position
+#   quit
+# Commands other than stop and quit wait for a running search to finish first.
+# Anything that cannot be parsed gets an "info string" reply and is otherwise ignored.
+
+
+class Protocol:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.lock = threading.Lock()
+        self.options = {name: spec[1] for name, spec in OPTIONS.items()}
+        self.position = Position.initial()
+        self.engine = None
+        self.tablebase = None
+        self.book = None
+        # The search running in the background, and the event that stops it
+        self.thread = None
+        self.stop = None
+
+    def send(self, line):
+        with self.lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def make_engine(self):
+        # Built on the first search and kept warm for every later game
+        if self.options["Tablebase"] and self.tablebase is None:
+            from tablebase import Tablebase
+            self.tablebase = Tablebase.load_default()
+        if self.options["OwnBook"] and self.book is None:
+            from book import Book
+            self.book = Book.load_default()
+        return Engine(max_depth=self.options["Depth"], tt=TranspositionTable(self.options["Hash"]),
+                      tablebase=self.tablebase if self.options["Tablebase"] else None,
+                      book=self.book if self.options["OwnBook"] else None,
+                      weights=load_default_weights(), instrument=True)
+
+    def handle(self, line):
+        # Returns False once the session should end
+        words = line.split()
+        if not words:
+            return True
+        command = getattr(self, "cmd_" + words[0], None)
+        if command is None:
+            self.send(f"info string unknown command {words[0]}")
+            return True
+        try:
+            return command(words[1:]) is not False
+        except ValueError as exc:
+            self.send(f"info string {exc}")
+            return True
+
+    def cmd_hxp(self, args):
+        self.send(f"id name {NAME}")
+        for name, spec in OPTIONS.items():
+            if spec[0] == "spin":
+                self.send(f"option name {name} type spin default {spec[1]} min {spec[2]} max {spec[3]}")
+            else:
+                self.send(f"option name {name} type check default {str(spec[1]).lower()}")
+        self.send("hxpok")
+
+    def cmd_isready(self, args):
+        self.wait()
+        self.send("readyok")
+
+    def cmd_setoption(self, args):
+        if len(args) != 4 or args[0] != "name" or args[2] != "value" or args[1] not in OPTIONS:
+            raise ValueError(f"expected setoption name {'|'.join(OPTIONS)} value V")
+        name, value = args[1], args[3]
+        spec = OPTIONS[name]
+        if spec[0] == "spin":
+            value = int(value)
+            if not spec[2] <= value <= spec[3]:
+                raise ValueError(f"{name} must be between {spec[2]} and {spec[3]}")
+        else:
+            value = value == "true"
+        self.wait()
+        self.options[name] = value
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    def cmd_newgame(self, args):
+        self.wait()
+        if self.engine is not None:
+            self.engine.stop_pondering()
+        self.position = Position.initial()
+
+    def cmd_position(self, args):
+        if args[:1] == ["startpos"]:
+            pos, rest = Position.initial(), args[1:]
+        elif args[:1] == ["text"] and len(args) >= 3:
+            pos = Position.from_text(" ".join(args[1:3]))
+            rest = args[3:]
+        else:
+            raise ValueError("expected position startpos|text ROWS SIDE [moves M ...]")
+        if rest[:1] == ["moves"]:
+            for word in rest[1:]:
+                pos.make(parse_move(pos, word))
+        elif rest:
+            raise ValueError(f"unexpected {rest[0]!r} after the position")
+        self.wait()
+        self.position = pos
+
+    def cmd_go(self, args):
+        depth = time_limit = None
+        infinite = False
+        words = iter(args)
+        for word in words:
+            if word == "depth":
+                depth = int(next(words, ""))
+            elif word == "movetime":
+                time_limit = int(next(words, "")) / 1000
+            elif word == "infinite":
+                infinite = True
+            else:
+                raise ValueError(f"unknown go parameter {word}")
+        self.wait()
+        pos = self.position.copy()
+        if pos.outcome()[0]:
+            self.send("bestmove none")
+            return
+        if self.engine is None:
+            self.engine = self.make_engine()
+        engine = self.engine
+        # The tablebase and book only hold positions of the standard board
+        standard = pos.geometry == DEFAULT
+        tablebase, book = engine.tablebase, engine.book
+        if not standard:
+            engine.tablebase = engine.book = None
+        if depth is None:
+            # Only a search without a time falls back to the Depth option
+            depth = pos.geometry.max_plies if infinite or time_limit is not None else self.options["Depth"]
+        self.stop = threading.Event()
+        stop = self.stop
+
+        def search():
+            try:
+                move = engine.choose_move(pos, time_limit, stop, depth)
+                self.report(engine.stats, pos, move)
+            finally:
+                engine.tablebase, engine.book = tablebase, book
+
+        self.thread = threading.Thread(target=search, daemon=True)
+        self.thread.start()
+
+    def cmd_stop(self, args):
+        if self.stop is not None:
+            self.stop.set()
+        self.wait()
+
+    def cmd_show(self, args):
+        self.send(f"info string {self.position.to_text()}")
+
+    def cmd_quit(self, args):
+        self.cmd_stop(args)
+        if self.engine is not None:
+            self.engine.close()
+        return False
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = self.stop = None
+
+    def report(self, stats, pos, move):
+        geometry = pos.geometry
+        if stats.source == "search":
+            for depth, nodes in enumerate(stats.iteration_nodes):
+                self.send(f"info depth {depth} nodes {nodes}")
+            line = f"info depth {stats.depth} nodes {stats.nodes} time {stats.elapsed * 1000:.0f}"
+            if stats.value is not None:
+                line += " score " + score_text(stats.value, pos.side)
+            if stats.nps:
+                line += f" nps {stats.nps:.0f}"
+            if stats.pv:
+                line += " pv " + " ".join(move_text(m, geometry) for m in stats.pv)
+            self.send(line)
+        else:
+            self.send(f"info string {stats.source} move")
+        self.send(f"bestmove {'none' if move is None else move_text(move, geometry)}")
+
+
+def parse_move(pos, word):
+    for move in pos.generate_moves():
+        if move_text(move, pos.geometry) == word:
+            return move
+    raise ValueError(f"illegal move {word} in {pos.to_text()}")
+
+
+def score_text(value, side):
+    # Engine scores are black minus white; the protocol reports the side to
+    # move's view, in hundredths of a pawn or as "mate N" in moves, negative
+    # when the side to move is the one losing
+    if side == 0:
+        value = -value
+    distance = mate_distance(value)
+    if distance is not None:
+        moves = (distance + 1) // 2
+        return f"mate {moves if value > 0 else -moves}"
+    return f"cp {round(value * 100)}"
+
+
+def serve(lines=sys.stdin, out=sys.stdout):
+    protocol = Protocol(out)
+    for line in lines:
+        if not protocol.handle(line):
+            break
+    else:
+        protocol.cmd_quit([])
+
+
+class EngineProcess:
+    # Client for an engine served by `python protocol.py` in a child process
+    def __init__(self, options=None):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.send("hxp")
+        self.read_until("hxpok")
+        for name, value in (options or {}).items():
+            if isinstance(value, bool):
+                value = str(value).lower()
+            self.send(f"setoption name {name} value {value}")
+        self.send("isready")
+        self.read_until("readyok")
+
+    def send(self, line):
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+
+    def read_until(self, prefix):
+        # Lines up to and including the first starting with prefix
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise EOFError("engine process exited")
+            lines.append(line.rstrip("\n"))
+            if line.startswith(prefix):
+                return lines
+
+    def best_move(self, text, moves=(), go="go"):
+        # The engine's move as text for the position after `moves`, or None
+        position = f"position text {text}" + (" moves " + " ".join(moves) if moves else "")
+        self.send(position)
+        self.send(go)
+        word = self.read_until("bestmove")[-1].split()[1]
+        return None if word == "none" else word
+
+    def close(self):
+        if self.process.poll() is None:
+            self.send("quit")
+            self.process.stdin.close()
+            self.process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the engine over a UCI-like protocol on stdin/stdout.")
+    parser.parse_args(argv)
+    serve()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import argparse
+import heapq
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+
+from engine import (BLACK, MOVE_NAMES, WHITE, Position, decode_move, encode_move, load_weights,
+                    move_text)
+
+MAGIC = b"HXGR"
+VERSION = 1
+# magic, version, reserved, hash of the start position every game begins from
+HEADER = struct.Struct("<4sHHQ")
+
+# Every record is one little-endian uint16. A move is engine.encode_move
+# (kind 0-2 in bits 12-13); kind 3 marks the end of a game and carries the
+# result in the low bits.
+END = 3 << 12
+RESULT_CODES = {WHITE: 0, BLACK: 1, None: 2}
+UNFINISHED = 3
+RESULT_NAMES = ("white", "black", "draw", "unfinished")
+
+READ_CHUNK = 1 << 16
+
+
+class GameWriter:
+    # Appends whole games to a record file, creating it with a header first
+    def __init__(self, path):
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            check_header(path)
+        self.file = open(path, "ab")
+        if new:
+            self.file.write(HEADER.pack(MAGIC, VERSION, 0, Position.initial().hash))
+
+    def write_game(self, moves, result=UNFINISHED):
+        # result is a side, None for a draw, or UNFINISHED for an abandoned game
+        code = result if result == UNFINISHED else RESULT_CODES[result]
+        records = array("H", [encode_move(move) for move in moves])
+        records.append(END | code)
+        if sys.byteorder == "big":
+            records.byteswap()
+        # One write per game, so an interrupted writer never leaves half a game
+        self.file.write(records.tobytes())
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a game record file")
+    magic, version, _, start_hash = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} game record file")
+    if start_hash != Position.initial().hash:
+        raise ValueError(f"{path} was recorded with different Zobrist keys or rules")
+
+
+def read_games(path):
+    # Yields (moves, result name) per game, reading the file a chunk at a time.
+    # Games are written whole, so a file that ends inside one is damaged and
+    # raises ValueError once the games before the damage are read.
+    check_header(path)
+    moves = []
+    # A byte of a record split across chunks, carried to the next one
+    tail = b""
+    with open(path, "rb") as f:
+        f.seek(HEADER.size)
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            chunk = tail + chunk
+            tail = chunk[len(chunk) & ~1:]
+            records = array("H")
+            records.frombytes(chunk[:len(chunk) & ~1])
+            if sys.byteorder == "big":
+                records.byteswap()
+            for value in records:
+                if value & END == END:
+                    yield moves, RESULT_NAMES[value & 0x3]
+                    moves = []
+                else:
+                    moves.append(decode_move(value))
+    if tail:
+        raise ValueError(f"{path} ends in the middle of a record")
+    if moves:
+        raise ValueError(f"{path} ends with {len(moves)} moves of a game that has no end record")
+
+
+def replay(moves):
+    # Yields the position before each move, then the final position
+    pos = Position.initial()
+    for move in moves:
+        yield pos
+        pos.make(move)
+    yield pos
+
+
+class Analysis:
+    # Opening, move and evaluation-swing statistics gathered one game at a time
+    def __init__(self, opening_plies=4, top=10, weights=None, batch_size=4096):
+        self.opening_plies = opening_plies
+        self.top = top
+        self.weights = weights
+        self.batch_size = batch_size
+        self.games = 0
+        self.moves = 0
+        self.results = Counter()
+        self.openings = Counter()
+        self.kinds = Counter()
+        # Moves played per position, by hash; bounded by the number of
+        # reachable positions however many games are read
+        self.choices = {}
+        self.seen = Counter()
+        self.texts = {}
+        # Min-heap of the largest swings and the positions waiting to be evaluated
+        self.swings = []
+        self.pending = []
+
+    def add(self, index, moves, result):
+        self.games += 1
+        self.moves += len(moves)
+        self.results[result] += 1
+        self.openings[tuple(moves[:self.opening_plies])] += 1
+        for ply, pos in enumerate(replay(moves)):
+            if ply == len(moves):
+                break
+            move = moves[ply]
+            self.kinds[move[2]] += 1
+            self.seen[pos.hash] += 1
+            self.choices.setdefault(pos.hash, Counter())[move] += 1
+            if pos.hash not in self.texts:
+                self.texts[pos.hash] = pos.to_text()
+            # A finished position has no static evaluation worth comparing
+            pos.make(move)
+            finished = pos.winner() is not None
+            pos.unmake(move)
+            if not finished:
+                self.pending.append((index, ply, move, pos.pawns[WHITE], pos.pawns[BLACK],
+                                     pos.blockers[WHITE], pos.blockers[BLACK], *self.child(pos, move)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def child(pos, move):
+        pos.make(move)
+        bitboards = (pos.pawns[WHITE], pos.pawns[BLACK], pos.blockers[WHITE], pos.blockers[BLACK])
+        pos.unmake(move)
+        return bitboards
+
+    def flush(self):
+        # Evaluate the positions before and after every pending move in one batch
+        if not self.pending:
+            return
+        from vectorized import evaluate_bitboards
+        before = evaluate_bitboards([entry[3:7] for entry in self.pending], self.weights)
+        after = evaluate_bitboards([entry[7:11] for entry in self.pending], self.weights)
+        for entry, old, new in zip(self.pending, before, after):
+            item = (abs(new - old), entry[0], entry[1], entry[2], old, new, entry[3:7])
+            if len(self.swings) < self.top:
+                heapq.heappush(self.swings, item)
+            elif item > self.swings[0]:
+                heapq.heapreplace(self.swings, item)
+        self.pending = []
+
+    def report(self):
+        self.flush()
+        print(f"{self.games} games, {self.moves} moves, "
+              + ", ".join(f"{self.results[name]} {name}" for name in RESULT_NAMES if self.results[name]))
+        if self.games:
+            print(f"  average length {self.moves / self.games:.1f} plies")
+        if self.moves:
+            print("  moves by kind: " + ", ".join(f"{MOVE_NAMES[kind]} {self.kinds[kind] / self.moves:.1%}"
+                                                    for kind in range(len(MOVE_NAMES))))
+
+        print(f"Most common openings ({self.opening_plies} plies):")
+        for moves, count in self.openings.most_common(self.top):
+            print(f"  {count:8d} {count / self.games:6.1%}  {' '.join(move_text(move) for move in moves)}")
+
+        print("Move choices in the most visited positions:")
+        for key, visits in self.seen.most_common(self.top):
+            choices = ", ".join(f"{move_text(move)} {count / visits:.0%}"
+                                for move, count in self.choices[key].most_common(3))
+            print(f"  {visits:8d}  {self.texts[key]}  {choices}")
+
+        print("Largest evaluation swings (black minus white):")
+        for swing, game, ply, move, old, new, (wp, bp, wb, bb) in sorted(self.swings, reverse=True):
+            # Games start from the initial position, so white moves on even plies
+            text = Position((wp, bp), (wb, bb), WHITE if ply % 2 == 0 else BLACK).to_text()
+            print(f"  game {game} ply {ply}: {text}  {move_text(move)} {old:+.2f} -> {new:+.2f} ({swing:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and analyze game record files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    dump = sub.add_parser("dump", help="print games move by move")
+    dump.add_argument("path")
+    dump.add_argument("-n", "--games", type=int, help="stop after this many games")
+    analyze = sub.add_parser("analyze", help="opening, move-choice and evaluation-swing statistics")
+    analyze.add_argument("path")
+    analyze.add_argument("--opening-plies", type=int, default=4)
+    analyze.add_argument("--top", type=int, default=10)
+    analyze.add_argument("--weights", metavar="PATH", help="evaluate with these weights instead of the defaults")
+    args = parser.parse_args(argv)
+
+    if args.command == "dump":
+        for index, (moves, result) in enumerate(read_games(args.path)):
+            if args.games is not None and index >= args.games:
+                break
+            print(f"{index}: {' '.join(move_text(move) for move in moves)} ({result})")
+    elif args.command == "analyze":
+        weights = load_weights(args.weights) if args.weights else None
+        analysis = Analysis(args.opening_plies, args.top, weights)
+        for index, (moves, result) in enumerate(read_games(args.path)):
+            analysis.add(index, moves, result)
+        analysis.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
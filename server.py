@@ -0,0 +1,430 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from arena import RESULT_NAMES, percentile
+from engine import DEFAULT, Engine, Position, TranspositionTable, load_default_weights, move_text
+from protocol import parse_move
+
+DEFAULT_PORT = 7878
+# Moves remembered by position for every session to reuse; the 4x4 board has
+# a few thousand reachable positions
+MOVE_CACHE_SIZE = 100000
+# Latencies kept for the percentiles in stats
+LATENCY_WINDOW = 100000
+
+
+class Session:
+    def __init__(self, session_id, pos):
+        self.id = session_id
+        self.position = pos
+        self.moves = []
+        # A session has at most one search queued or running at a time
+        self.busy = False
+        # Set when the session is closed during a search; it goes once the search ends
+        self.closing = False
+        # Record files replay every game from the standard start, so only
+        # games that began there can be recorded
+        self.from_start = pos.geometry == DEFAULT and pos.hash == Position.initial().hash
+        # Whether the game is over, and its winner, None for a draw
+        self.over, self.winner = pos.outcome()
+
+    def finished(self):
+        return self.over
+
+    def make(self, move):
+        self.position.make(move)
+        self.moves.append(move)
+        self.over, self.winner = self.position.outcome()
+
+    def result(self):
+        # "white", "black" or "draw" once the game is over, else None
+        return RESULT_NAMES[self.winner] if self.over else None
+
+    def as_dict(self):
+        return {"session": self.id, "position": self.position.to_text(), "result": self.result()}
+
+
+class GameServer:
+    # Many game sessions in one process. AI moves are searched on a small
+    # thread pool fed from one bounded FIFO queue: every session has at most
+    # one search outstanding, so sessions are served in turn, and once the
+    # queue is full further requests wait for room instead of piling up.
+    # The engines on all threads share one transposition table, tablebase
+    # and book, and a move cache answers positions any session has already
+    # asked about without searching. Searches hold the GIL, so extra
+    # threads add fairness rather than speed; run one server per core.
+    def __init__(self, workers=1, max_pending=64, depth=4, time_limit=None, tt_size_mb=64, tablebase=True,
+                 book=True, record=None, cache_size=MOVE_CACHE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.depth = depth
+        self.time_limit = time_limit
+        self.tt = TranspositionTable(tt_size_mb)
+        self.tablebase = None
+        if tablebase:
+            from tablebase import Tablebase
+            self.tablebase = Tablebase.load_default()
+        self.book = None
+        if book:
+            from book import Book
+            self.book = Book.load_default()
+        self.weights = load_default_weights()
+        self.local = threading.local()
+        self.executor = None
+        self.queue = None
+        self.runners = []
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.writer = None
+        if record:
+            from records import GameWriter
+            self.writer = GameWriter(record)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.searches = 0
+        self.cache_hits = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self):
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="search")
+        self.queue = asyncio.Queue(self.max_pending)
+        self.runners = [asyncio.create_task(self.run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for runner in self.runners:
+            runner.cancel()
+        await asyncio.gather(*self.runners, return_exceptions=True)
+        self.runners = []
+        self.executor.shutdown()
+        if self.writer is not None:
+            self.writer.close()
+
+    def engine(self):
+        # One engine per search thread, all sharing the table, tablebase and book
+        engine = getattr(self.local, "engine", None)
+        if engine is None:
+            engine = self.local.engine = Engine(max_depth=self.depth, time_limit=self.time_limit, tt=self.tt,
+                                                tablebase=self.tablebase, book=self.book, weights=self.weights)
+        return engine
+
+    def search(self, pos):
+        return self.engine().choose_move(pos)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pos, future = await self.queue.get()
+            try:
+                move = await loop.run_in_executor(self.executor, self.search, pos)
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(move)
+            finally:
+                self.queue.task_done()
+
+    async def best_move(self, pos):
+        move = self.cache.get(pos.hash)
+        if move is not None and move in pos.generate_moves():
+            self.cache.move_to_end(pos.hash)
+            self.cache_hits += 1
+            return move
+        future = asyncio.get_running_loop().create_future()
+        # Waits here while the queue is full
+        await self.queue.put((pos.copy(), future))
+        move = await future
+        self.searches += 1
+        if move is not None and self.cache_size:
+            self.cache[pos.hash] = move
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return move
+
+    def new_game(self, text=None):
+        if text is not None and not isinstance(text, str):
+            raise ValueError(f"position text must be a string, got {text!r}")
+        pos = Position.initial() if text is None else Position.from_text(text)
+        session = Session(next(self.ids), pos)
+        self.sessions[session.id] = session
+        return session
+
+    def session(self, session_id):
+        if not isinstance(session_id, int) or isinstance(session_id, bool):
+            raise ValueError(f"session must be an integer id, got {session_id!r}")
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ValueError(f"no session {session_id}")
+        return session
+
+    async def ai_move(self, session):
+        # The engine plays the side to move; returns the move, or None if it had none
+        if session.finished():
+            return None
+        if session.busy:
+            raise ValueError(f"session {session.id} is already waiting for a move")
+        session.busy = True
+        start_time = time.perf_counter()
+        try:
+            move = await self.best_move(session.position)
+            self.latencies.append(time.perf_counter() - start_time)
+            if move is not None:
+                session.make(move)
+                if session.finished():
+                    self.save(session)
+        finally:
+            session.busy = False
+            if session.closing:
+                self.close_game(session)
+        return move
+
+    def play(self, session, word):
+        if session.finished():
+            raise ValueError(f"session {session.id} is over: {session.result()}")
+        if session.busy:
+            raise ValueError(f"session {session.id} is waiting for the engine")
+        session.make(parse_move(session.position, word))
+        if session.finished():
+            self.save(session)
+
+    def close_game(self, session):
+        if session.busy:
+            raise ValueError(f"session {session.id} is waiting for the engine")
+        if not session.finished():
+            self.save(session)
+        del self.sessions[session.id]
+
+    def save(self, session):
+        if self.writer is None or not session.from_start:
+            return
+        from records import UNFINISHED
+        self.writer.write_game(session.moves, session.winner if session.over else UNFINISHED)
+
+    def stats(self):
+        latencies = list(self.latencies)
+        lookups = self.searches + self.cache_hits
+        return {
+            "sessions": len(self.sessions),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "searches": self.searches,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else None,
+            # NaN is not JSON, so no latencies yet reads as null
+            "latency_ms": {name: percentile(latencies, fraction) * 1000 if latencies else None
+                           for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+        }
+
+    async def handle(self, request, owned=None):
+        # One request as a dict: {"op": "new", "text": optional position text},
+        # {"op": "play", "session": id, "move": "a1-a2"} for the player's move
+        # followed by the engine's reply, {"op": "go", "session": id} for an
+        # engine move alone, {"op": "close", "session": id} or {"op": "stats"}.
+        # New session ids are added to `owned` when given.
+        if not isinstance(request, dict):
+            return {"error": "expected one JSON object per line"}
+        op = request.get("op")
+        try:
+            if op == "new":
+                session = self.new_game(request.get("text"))
+                if owned is not None:
+                    owned.add(session.id)
+                reply = session.as_dict()
+            elif op == "play":
+                session = self.session(request.get("session"))
+                self.play(session, request.get("move", ""))
+                move = await self.ai_move(session)
+                reply = dict(session.as_dict(), move=None if move is None else move_text(move))
+            elif op == "go":
+                session = self.session(request.get("session"))
+                move = await self.ai_move(session)
+                reply = dict(session.as_dict(), move=None if move is None else move_text(move))
+            elif op == "close":
+                self.close_game(self.session(request.get("session")))
+                reply = {"session": request.get("session"), "closed": True}
+            elif op == "stats":
+                reply = self.stats()
+            else:
+                raise ValueError(f"unknown op {op!r}")
+        except (ValueError, TypeError) as exc:
+            reply = {"error": str(exc)}
+        if "id" in request:
+            reply["id"] = request["id"]
+        return reply
+
+    async def serve_client(self, reader, writer):
+        # JSON lines in both directions. Requests run concurrently and replies
+        # carry the request's "id"; at most max_pending requests per
+        # connection are in flight, after which the socket is not read.
+        # Games started on a connection are closed when it goes away.
+        lock = asyncio.Lock()
+        slots = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+        owned = set()
+
+        async def answer(request):
+            try:
+                reply = await self.handle(request, owned)
+                async with lock:
+                    writer.write((json.dumps(reply) + "\n").encode())
+                    await writer.drain()
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+                line = await reader.readline()
+                if not line:
+                    slots.release()
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                task = asyncio.create_task(answer(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            try:
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for session_id in owned:
+                    session = self.sessions.get(session_id)
+                    if session is None:
+                        continue
+                    if session.busy:
+                        # Another connection's search holds it; ai_move closes it after
+                        session.closing = True
+                    else:
+                        self.close_game(session)
+            finally:
+                writer.close()
+
+
+class LocalClient:
+    # Stands in for a network client: the same requests and replies, without a socket
+    def __init__(self, server):
+        self.server = server
+
+    async def request(self, **request):
+        return await self.server.handle(request)
+
+
+async def player(client, rng, think, deadline, counts):
+    # Plays white with random legal moves, thinking `think` seconds on
+    # average, starting a new game whenever one ends
+    while time.perf_counter() < deadline:
+        reply = await client.request(op="new")
+        session = reply["session"]
+        pos = Position.from_text(reply["position"])
+        while reply["result"] is None and time.perf_counter() < deadline:
+            await asyncio.sleep(rng.expovariate(1 / think) if think else 0)
+            word = move_text(rng.choice(pos.generate_moves()))
+            reply = await client.request(op="play", session=session, move=word)
+            if "error" in reply:
+                raise RuntimeError(reply["error"])
+            pos = Position.from_text(reply["position"])
+            counts["moves"] += reply["move"] is not None
+        counts["games"] += reply["result"] is not None
+        await client.request(op="close", session=session)
+
+
+async def load(server, sessions, duration, think, seed=1):
+    # `sessions` simulated players for `duration` seconds; returns the
+    # server's stats plus throughput and CPU use
+    server.reset_stats()
+    client = LocalClient(server)
+    rng = random.Random(seed)
+    counts = {"moves": 0, "games": 0}
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    deadline = start_time + duration
+    await asyncio.gather(*(player(client, random.Random(rng.getrandbits(32)), think, deadline, counts)
+                           for _ in range(sessions)))
+    elapsed = time.perf_counter() - start_time
+    stats = server.stats()
+    stats.update(concurrent=sessions, games=counts["games"], moves_per_s=counts["moves"] / elapsed,
+                 cpu=(time.process_time() - start_cpu) / elapsed)
+    return stats
+
+
+async def run_load(args):
+    server = GameServer(args.workers, args.max_pending, args.depth, args.time, args.tt,
+                        not args.no_tablebase, not args.no_book, args.record, args.cache)
+    await server.start()
+    supported = 0
+    try:
+        for sessions in args.sessions:
+            stats = await load(server, sessions, args.duration, args.think)
+            latency = {name: float("nan") if ms is None else ms for name, ms in stats["latency_ms"].items()}
+            ok = latency["p99"] <= args.target_ms
+            if ok:
+                supported = sessions
+            hits = stats["cache_hit_rate"]
+            print(f"{sessions:5d} sessions: {stats['moves_per_s']:7.1f} moves/s, {stats['games']} games, "
+                  f"p50 {latency['p50']:.2f} ms, p99 {latency['p99']:.2f} ms, "
+                  f"cache hits {'-' if hits is None else f'{hits:.0%}'}, CPU {stats['cpu']:.0%}"
+                  + ("" if ok else f"  (p99 over {args.target_ms:g} ms)"))
+    finally:
+        await server.stop()
+    # The searches share one interpreter, so one server uses one core
+    print(f"{supported} sessions per core with p99 within {args.target_ms:g} ms "
+          f"at {args.think:g} s mean think time")
+
+
+async def run_server(args):
+    server = GameServer(args.workers, args.max_pending, args.depth, args.time, args.tt,
+                        not args.no_tablebase, not args.no_book, args.record, args.cache)
+    await server.start()
+    listener = await asyncio.start_server(server.serve_client, args.host, args.port)
+    print(f"Serving on {args.host}:{args.port}", flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many Hexapawn games against one shared engine.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="accept JSON-lines clients over TCP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    bench = sub.add_parser("load", help="measure latency under simulated players on an in-process client")
+    bench.add_argument("--sessions", type=lambda text: [int(n) for n in text.split(",")], default=[10, 100, 1000],
+                       help="comma-separated numbers of concurrent players to try")
+    bench.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    bench.add_argument("--think", type=float, default=1.0, help="players' mean think time in seconds")
+    bench.add_argument("--target-ms", type=float, default=50.0, help="p99 move latency a run must stay within")
+    for command in (serve, bench):
+        command.add_argument("--workers", type=int, default=1, help="search threads")
+        command.add_argument("--max-pending", type=int, default=64, help="queued searches before requests wait")
+        command.add_argument("--depth", type=int, default=4)
+        command.add_argument("--time", type=float, help="search time per move in seconds instead of a fixed depth")
+        command.add_argument("--tt", type=int, default=64, help="shared transposition table size in MB")
+        command.add_argument("--no-tablebase", action="store_true")
+        command.add_argument("--no-book", action="store_true")
+        command.add_argument("--cache", type=int, default=MOVE_CACHE_SIZE, help="moves cached by position; 0 disables")
+        command.add_argument("--record", metavar="PATH", help="append every game to this binary record file")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(run_server(args) if args.command == "serve" else run_load(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+import engine
+from engine import Position
+
+# Results from the point of view of the side to move
+LOSS, DRAW, WIN = 0, 1, 2
+RESULT_NAMES = ("loss", "draw", "win")
+
+MAGIC = b"HXTB"
+VERSION = 1
+# magic, version, reserved, entries, buckets, hash of the start position
+HEADER = struct.Struct("<4sHHIIQ")
+MASK64 = (1 << 64) - 1
+BUCKET_SIZE = 4
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hexapawn.tb")
+
+
+def _slot(key, seed, size):
+    # splitmix64 finalizer over the key perturbed by the bucket's seed
+    x = (key ^ (seed * 0x9E3779B97F4A7C15)) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return (x ^ (x >> 31)) % size
+
+
+def solve(root=None):
+    # Label every position reachable from root with (result, distance to end).
+    # Pawns only move forward, so the game graph is acyclic and a post-order
+    # walk visits each position after all of its successors.
+    if root is None:
+        root = Position.initial()
+    table = {}
+
+    def visit(pos):
+        key = pos.hash
+        if key in table:
+            return table[key]
+        if pos.winner() is not None:
+            # The side that just moved has won
+            table[key] = (LOSS, 0)
+            return table[key]
+        moves = pos.generate_moves()
+        if not moves:
+            table[key] = (DRAW, 0)
+            return table[key]
+        children = []
+        for move in moves:
+            pos.make(move)
+            children.append(visit(pos))
+            pos.unmake(move)
+        wins = [dist for result, dist in children if result == LOSS]
+        draws = [dist for result, dist in children if result == DRAW]
+        if wins:
+            table[key] = (WIN, min(wins) + 1)
+        elif draws:
+            table[key] = (DRAW, min(draws) + 1)
+        else:
+            table[key] = (LOSS, max(dist for _, dist in children) + 1)
+        return table[key]
+
+    visit(root.copy())
+    return table
+
+
+def build_index(keys):
+    # CHD-style minimal perfect hash: keys are split into buckets, and each
+    # bucket (largest first) searches for a seed that sends all its keys to
+    # free slots.
+    size = len(keys)
+    buckets = max(1, size // BUCKET_SIZE)
+    members = [[] for _ in range(buckets)]
+    for key in keys:
+        members[key % buckets].append(key)
+
+    seeds = [0] * buckets
+    slots = [None] * size
+    for bucket in sorted(range(buckets), key=lambda b: -len(members[b])):
+        group = members[bucket]
+        if not group:
+            continue
+        seed = 0
+        while True:
+            targets = [_slot(key, seed, size) for key in group]
+            if len(set(targets)) == len(targets) and all(slots[t] is None for t in targets):
+                break
+            seed += 1
+        seeds[bucket] = seed
+        for key, target in zip(group, targets):
+            slots[target] = key
+    return seeds, slots
+
+
+def write(path, table):
+    seeds, slots = build_index(list(table))
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(slots), len(seeds), Position.initial().hash))
+        f.write(struct.pack(f"<{len(slots)}Q", *slots))
+        f.write(struct.pack(f"<{len(slots)}H", *(table[key][0] << 8 | table[key][1] for key in slots)))
+        f.write(struct.pack(f"<{len(seeds)}I", *seeds))
+
+
+class Tablebase:
+    def __init__(self, path=DEFAULT_PATH):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.size, self.buckets, start_hash = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} tablebase")
+        if start_hash != Position.initial().hash:
+            raise ValueError(f"{path} was built with different Zobrist keys or rules")
+        view = memoryview(self.map)
+        offset = HEADER.size
+        self.keys = view[offset:offset + 8 * self.size].cast("Q")
+        offset += 8 * self.size
+        self.values = view[offset:offset + 2 * self.size].cast("H")
+        offset += 2 * self.size
+        self.seeds = view[offset:offset + 4 * self.buckets].cast("I")
+
+    @classmethod
+    def load_default(cls):
+        # The tablebase is optional; callers fall back to search without it
+        if not os.path.exists(DEFAULT_PATH):
+            return None
+        return cls(DEFAULT_PATH)
+
+    def close(self):
+        for view in (self.keys, self.values, self.seeds):
+            view.release()
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.size
+
+    def probe(self, pos):
+        # Returns (result, distance) for the side to move, or None if unknown
+        key = pos.hash
+        index = _slot(key, self.seeds[key % self.buckets], self.size)
+        if self.keys[index] != key:
+            return None
+        value = self.values[index]
+        return value >> 8, value & 0xFF
+
+    def best_move(self, pos):
+        # Win as fast as possible, otherwise draw, otherwise lose as slowly as possible
+        best = None
+        best_rank = None
+        for move in pos.generate_moves():
+            pos.make(move)
+            entry = self.probe(pos)
+            pos.unmake(move)
+            if entry is None:
+                return None
+            result, dist = entry
+            rank = (2 - result, -dist if result == LOSS else dist)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        return best
+
+
+def check_engine(tb, depth):
+    # Count positions where the depth-limited search picks a move that gives
+    # away the game-theoretic result
+    checked = worse = 0
+    seen = set()
+    stack = [Position.initial()]
+    while stack:
+        pos = stack.pop()
+        if pos.hash in seen or pos.winner() is not None:
+            continue
+        seen.add(pos.hash)
+        moves = pos.generate_moves()
+        if not moves:
+            continue
+        for move in moves:
+            child = pos.copy()
+            child.make(move)
+            stack.append(child)
+        result, _ = tb.probe(pos)
+        move, _ = engine.best_move(pos, depth)
+        if move is None:
+            continue
+        checked += 1
+        pos.make(move)
+        after, _ = tb.probe(pos)
+        pos.unmake(move)
+        if 2 - after < result:
+            worse += 1
+    return checked, worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve Hexapawn and build or inspect the tablebase file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="solve every reachable position and write the tablebase")
+    build.add_argument("-o", "--output", default=DEFAULT_PATH)
+    stats = sub.add_parser("stats", help="summarize a tablebase file")
+    stats.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    check = sub.add_parser("check", help="score the search engine against the tablebase")
+    check.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    check.add_argument("--depth", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start_time = time.time()
+        table = solve()
+        write(args.output, table)
+        print(f"Solved {len(table)} positions in {time.time() - start_time:.2f} seconds, "
+              f"wrote {os.path.getsize(args.output)} bytes to {args.output}")
+    elif args.command == "stats":
+        tb = Tablebase(args.path)
+        result, dist = tb.probe(Position.initial())
+        print(f"{len(tb)} positions; start position is a {RESULT_NAMES[result]} for white in {dist} plies")
+        tb.close()
+    elif args.command == "check":
+        tb = Tablebase(args.path)
+        checked, worse = check_engine(tb, args.depth)
+        print(f"Depth {args.depth} search gave away the result in {worse} of {checked} positions")
+        tb.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+import random
+import sys
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import DEFAULT, Geometry, Position
+
+# Boards the geometry-generic tests run on
+GEOMETRIES = [DEFAULT, Geometry(5, 5), Geometry(6, 4, pawns=3), Geometry(3, 7), Geometry(7, 3),
+              Geometry(8, 8, blockers=((5, 6), (4, 1)))]
+
+
+def random_games(geometry, games, seed):
+    # (position, move) along `games` random games played to the end. The
+    # position is shared and the move is made on it after each yield, so
+    # copy it to keep it.
+    rng = random.Random(seed)
+    for _ in range(games):
+        pos = Position.initial(geometry)
+        while not pos.outcome()[0]:
+            move = rng.choice(pos.generate_moves())
+            yield pos, move
+            pos.make(move)
+
+
+def random_positions(geometry, count, seed, max_plies=10):
+    # `count` unfinished positions, each fewer than max_plies random moves from the start
+    rng = random.Random(seed)
+    found = []
+    while len(found) < count:
+        pos = Position.initial(geometry)
+        for _ in range(rng.randrange(max_plies)):
+            if pos.outcome()[0]:
+                break
+            pos.make(rng.choice(pos.generate_moves()))
+        if not pos.outcome()[0]:
+            found.append(pos)
+    return found
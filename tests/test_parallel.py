@@ -0,0 +1,20 @@
+import pytest
+
+from conftest import random_positions
+from engine import DEFAULT, Geometry, Search, TranspositionTable
+from parallel import ParallelSearch
+
+
+@pytest.fixture(scope="module", params=[16, 0], ids=["tt", "no-tt"])
+def search(request):
+    with ParallelSearch(2, request.param) as search:
+        yield search
+
+
+@pytest.mark.parametrize("geometry, depths", [(DEFAULT, (1, 2, 4, 6, 8)), (Geometry(5, 5), (2, 4))], ids=repr)
+def test_same_move_as_serial(search, geometry, depths):
+    for pos in random_positions(geometry, 30 if geometry == DEFAULT else 6, 1):
+        for depth in depths:
+            serial = Search(TranspositionTable(search.tt_size_mb) if search.tt_size_mb else None)
+            expected = serial.iterate(pos, depth)
+            assert search.best_move(pos, depth) == expected, (pos.to_text(), depth)
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import pytest
+
+from engine import Engine, Geometry, Position, TranspositionTable, move_text
+from tablebase import Tablebase
+
+
+def test_ponder_hit_keeps_the_source():
+    tablebase = Tablebase.load_default()
+    if tablebase is None:
+        pytest.skip("no tablebase file")
+    engine = Engine(tablebase=tablebase, instrument=True)
+    pos = Position.initial()
+    pos.make(pos.generate_moves()[0])
+    predicted = engine.ponder(pos)
+    pos.make(predicted)
+    move = engine.choose_move(pos)
+    assert engine.stats.ponder_hit
+    assert engine.stats.source == "tablebase"
+    assert move_text(move) in engine.stats.summary()
+    engine.close()
+
+
+def test_stop_cancels_a_ponder_hit():
+    # A ponder search that would run for a long time, collected with stop already set
+    engine = Engine(time_limit=30, tt=TranspositionTable(1))
+    pos = Position.initial(Geometry(7, 7))
+    predicted = engine.ponder(pos, time_limit=30)
+    pos.make(predicted)
+    stop = threading.Event()
+    stop.set()
+    start_time = time.perf_counter()
+    engine.choose_move(pos, stop=stop)
+    assert time.perf_counter() - start_time < 5
+    engine.close()
@@ -0,0 +1,131 @@
+import pytest
+
+from conftest import GEOMETRIES, random_games
+from engine import BLACK, CAPTURE, MOVE, PUSH, WHITE, Position, perft
+
+
+class Rules:
+    # The game written out square by square, as the original GUI did, to
+    # check the bitboard tables against. board maps (row, col) to
+    # (side, is_blocker) for every occupied square.
+    def __init__(self, pos):
+        self.geometry = pos.geometry
+        self.rows, self.cols = self.geometry.rows, self.geometry.cols
+        self.board = {}
+        for sq in range(self.geometry.squares):
+            piece = pos.piece_at(sq)
+            if piece is not None:
+                self.board[divmod(sq, self.cols)] = piece
+
+    def pawn(self, row, col, side):
+        return self.board.get((row, col)) == (side, False)
+
+    def blocker(self, row, col, side):
+        return self.board.get((row, col)) == (side, True)
+
+    def moves(self, side):
+        # Per pawn in square order: forward, capture left, capture right, push right, push left
+        other = side ^ 1
+        step = -1 if side == WHITE else 1
+        moves = []
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if not self.pawn(row, col, side) or not 0 <= row + step < self.rows:
+                    continue
+                ahead = row + step
+                frm = row * self.cols + col
+                if (ahead, col) not in self.board:
+                    moves.append((frm, ahead * self.cols + col, MOVE))
+                for target in (col - 1, col + 1):
+                    if 0 <= target < self.cols and self.pawn(ahead, target, other):
+                        moves.append((frm, ahead * self.cols + target, CAPTURE))
+                for target in (col + 1, col - 1):
+                    if (0 <= target < self.cols and self.pawn(row, target, side)
+                            and self.blocker(ahead, target, other)):
+                        moves.append((frm, ahead * self.cols + target, PUSH))
+        return moves
+
+    def winner(self):
+        if any(self.pawn(0, col, WHITE) for col in range(self.cols)):
+            return WHITE
+        if any(self.pawn(self.rows - 1, col, BLACK) for col in range(self.cols)):
+            return BLACK
+        pawns = [piece for piece in self.board.values() if not piece[1]]
+        if (WHITE, False) not in pawns:
+            return BLACK
+        if (BLACK, False) not in pawns:
+            return WHITE
+        return None
+
+    def evaluate(self):
+        pawn_value, blocker_value, advance_bonus, center_bonus, mobility_bonus, back_row_bonus = self.geometry.weights
+        score = 0.0
+        for (row, col), (side, is_blocker) in self.board.items():
+            sign = 1 if side == BLACK else -1
+            value = blocker_value if is_blocker else pawn_value + advance_bonus * (row if side == BLACK else self.rows - row)
+            if self.geometry.center >> (row * self.cols + col) & 1:
+                value += center_bonus
+            if row == (self.rows - 1 if side == BLACK else 0):
+                value += back_row_bonus
+            score += sign * value
+        return score + mobility_bonus * (len(self.moves(BLACK)) - len(self.moves(WHITE)))
+
+
+def test_perft():
+    pos = Position.initial()
+    assert [perft(pos, depth) for depth in range(1, 9)] == [3, 9, 25, 72, 216, 611, 1567, 3473]
+
+
+@pytest.mark.parametrize("geometry", GEOMETRIES, ids=repr)
+def test_moves_match_rules(geometry):
+    for pos, _ in random_games(geometry, 40, 1):
+        rules = Rules(pos)
+        assert pos.winner() == rules.winner()
+        for side in (WHITE, BLACK):
+            moves = rules.moves(side)
+            assert pos.generate_moves(side) == moves, pos.to_text()
+            assert pos.count_moves(side) == len(moves)
+            assert pos.has_legal_moves(side) == bool(moves)
+
+
+def assert_matches_scratch(pos):
+    scratch = Position(pos.pawns, pos.blockers, pos.side, pos.geometry)
+    assert pos.hash == scratch.hash
+    assert pos.score == pytest.approx(scratch.score)
+    assert pos.counts == scratch.counts
+    assert pos.winner() == scratch.winner()
+    assert pos.evaluate() == pytest.approx(Rules(pos).evaluate())
+
+
+@pytest.mark.parametrize("geometry", GEOMETRIES, ids=repr)
+def test_make_unmake_keeps_incremental_state(geometry):
+    start = Position.initial(geometry)
+    for game in range(40):
+        played = []
+        for pos, move in random_games(geometry, 1, game):
+            # Every move is made and unmade before the game goes on with one of them
+            for child in pos.generate_moves():
+                before = pos.to_text(), pos.hash, pos.score, pos.counts[:], pos.winner()
+                pos.make(child)
+                assert_matches_scratch(pos)
+                pos.unmake(child)
+                assert (pos.to_text(), pos.hash, pos.score, pos.counts, pos.winner()) == before
+            played.append(move)
+        # By the end of the game the generator has made every move on pos
+        for move in reversed(played):
+            pos.unmake(move)
+        assert (pos.to_text(), pos.hash, pos.score) == (start.to_text(), start.hash, start.score)
+        assert not pos.undo
+
+
+@pytest.mark.parametrize("text", ["bbbb/.B......b/..W./wwww w", "bbbb/.B../..W./wwww", "bbbb/.B../..W./wwww x",
+                                  "bbbb/.B../..W?/wwww w", "bbb/.B../..W./wwww b", ""])
+def test_from_text_rejects_bad_text(text):
+    with pytest.raises(ValueError):
+        Position.from_text(text)
+
+
+@pytest.mark.parametrize("geometry", GEOMETRIES, ids=repr)
+def test_text_round_trip(geometry):
+    for pos, _ in random_games(geometry, 5, 3):
+        assert Position.from_text(pos.to_text(), geometry).hash == pos.hash
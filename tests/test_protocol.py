@@ -0,0 +1,34 @@
+import io
+
+from protocol import Protocol
+
+
+def session(*lines):
+    # Every line the engine sends in reply to `lines`
+    out = io.StringIO()
+    protocol = Protocol(out)
+    protocol.handle("setoption name Tablebase value false")
+    protocol.handle("setoption name OwnBook value false")
+    for line in lines:
+        protocol.handle(line)
+    protocol.cmd_quit([])
+    return out.getvalue().splitlines()
+
+
+def test_bad_position_text_is_reported():
+    for text in ("bbbb/.B......b/..W./wwww w", "bbbb/.B../..W?/wwww w", "bbbb/.B../..W./wwww x"):
+        replies = session(f"position text {text}", "show")
+        assert replies[0].startswith("info string expected") or replies[0].startswith("info string unknown")
+        assert replies[1] == "info string bbbb/.B../..W./wwww w"
+
+
+def test_go_without_a_move_replies_bestmove_none():
+    # Black has no pawns left, then neither side can move
+    for text in ("..../.B../w.W./.www b", "b.../w.../..../.... b"):
+        assert session(f"position text {text}", "go depth 2") == ["bestmove none"]
+
+
+def test_go_reports_info_then_bestmove():
+    replies = session("position startpos", "go depth 2")
+    assert replies[-1].startswith("bestmove ") and replies[-1] != "bestmove none"
+    assert replies[-2].startswith("info depth 2 ")
@@ -0,0 +1,48 @@
+import pytest
+
+from engine import Position
+from records import GameWriter, check_header, read_games
+
+
+def write_games(path, games):
+    with GameWriter(path) as writer:
+        for moves, result in games:
+            writer.write_game(moves, result)
+
+
+def short_game():
+    pos = Position.initial()
+    moves = []
+    for _ in range(3):
+        moves.append(pos.generate_moves()[0])
+        pos.make(moves[-1])
+    return moves
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "games.hxg")
+    moves = short_game()
+    write_games(path, [(moves, None), (moves[:1], 0)])
+    assert list(read_games(path)) == [(moves, "draw"), (moves[:1], "white")]
+
+
+@pytest.mark.parametrize("cut", [1, 2], ids=["mid-record", "mid-game"])
+def test_truncated_file_raises_after_whole_games(tmp_path, cut):
+    path = tmp_path / "games.hxg"
+    moves = short_game()
+    write_games(str(path), [(moves, 1), (moves, 1)])
+    path.write_bytes(path.read_bytes()[:-cut])
+    games = read_games(str(path))
+    assert next(games) == (moves, "black")
+    with pytest.raises(ValueError):
+        next(games)
+
+
+def test_writer_rejects_other_files_without_opening_them(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a record file at all")
+    with pytest.raises(ValueError):
+        GameWriter(str(path))
+    assert path.read_bytes() == b"not a record file at all"
+    with pytest.raises(ValueError):
+        check_header(str(path))
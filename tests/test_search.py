@@ -0,0 +1,72 @@
+import pytest
+
+from conftest import random_positions
+from engine import BLACK, DEFAULT, DRAW, MATE, Geometry, Search, SearchStats, tactical_moves
+
+
+def reference(pos, depth, ply, quiescence):
+    # Plain minimax with the search's scoring and no pruning, for the side to move
+    winner = pos.winner()
+    if winner is not None:
+        return MATE - ply if winner == pos.side else ply - MATE
+    if depth == 0:
+        value = pos.evaluate() if pos.side == BLACK else -pos.evaluate()
+        if not quiescence:
+            return value
+        moves = pos.generate_moves()
+        if not moves:
+            return DRAW
+        # Past the horizon the side to move may stand on the static score
+        for move in tactical_moves(pos, moves):
+            pos.make(move)
+            value = max(value, -reference(pos, 0, ply + 1, True))
+            pos.unmake(move)
+        return value
+    moves = pos.generate_moves()
+    if not moves:
+        return DRAW
+    scores = []
+    for move in moves:
+        pos.make(move)
+        scores.append(-reference(pos, depth - 1, ply + 1, quiescence))
+        pos.unmake(move)
+    return max(scores)
+
+
+def root_value(pos, depth, quiescence):
+    # Black minus white, over depth + 1 plies like Search.iterate
+    best = None
+    for move in pos.generate_moves():
+        pos.make(move)
+        score = -reference(pos, depth, 1, quiescence)
+        pos.unmake(move)
+        best = score if best is None else max(best, score)
+    return best if pos.side == BLACK else -best
+
+
+class Scouting(Search):
+    # Null windows at every node and a narrow aspiration window, so both re-search paths run
+    PVS_DEPTH = 0
+    ASPIRATION = 0.1
+
+
+CASES = ([(pos, 3) for pos in random_positions(DEFAULT, 60, 7, max_plies=8)]
+         + [(pos, 2) for pos in random_positions(Geometry(5, 5), 8, 2, max_plies=8)])
+
+
+@pytest.mark.parametrize("search_class", [Search, Scouting], ids=["default", "scouting"])
+@pytest.mark.parametrize("quiescence", [False, True], ids=["plain", "quiescence"])
+def test_values_match_minimax(search_class, quiescence):
+    researched = 0
+    for pos, depth in CASES:
+        stats = SearchStats()
+        move, value = search_class(stats=stats, quiescence=quiescence).iterate(pos, depth)
+        # A proven result can end the deepening early
+        assert value == pytest.approx(root_value(pos, stats.depth, quiescence))
+        pos.make(move)
+        child = -reference(pos, stats.depth, 1, quiescence)
+        pos.unmake(move)
+        assert (child if pos.side == BLACK else -child) == pytest.approx(value)
+        researched += stats.researches
+    if search_class is Scouting:
+        assert researched
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+
+from records import read_games
+from server import GameServer, LocalClient
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def play_out(client, session):
+    reply = await client.request(op="go", session=session)
+    while reply["result"] is None:
+        reply = await client.request(op="go", session=session)
+    return reply
+
+
+def test_bad_requests_get_error_replies():
+    async def main():
+        server = GameServer(tablebase=False, book=False)
+        await server.start()
+        try:
+            client = LocalClient(server)
+            for request in ({"op": "go", "session": [1]}, {"op": "go", "session": "1"},
+                            {"op": "new", "text": 5}, {"op": "close", "session": 99}):
+                assert "error" in await client.request(**request)
+        finally:
+            await server.stop()
+    run(main())
+
+
+def test_only_games_from_the_start_are_recorded(tmp_path):
+    path = str(tmp_path / "games.hxg")
+
+    async def main():
+        server = GameServer(depth=2, tablebase=False, book=False, record=path)
+        await server.start()
+        try:
+            client = LocalClient(server)
+            custom = await client.request(op="new", text="bbbbb/...../...B./.W.../wwwww w")
+            await play_out(client, custom["session"])
+            standard = await client.request(op="new")
+            await play_out(client, standard["session"])
+        finally:
+            await server.stop()
+    run(main())
+    games = list(read_games(path))
+    assert len(games) == 1
+
+
+def test_sessions_close_with_their_connection():
+    async def main():
+        server = GameServer(depth=2, tablebase=False, book=False)
+        await server.start()
+        listener = await asyncio.start_server(server.serve_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for _ in range(3):
+                writer.write(b'{"op": "new"}\n')
+                await writer.drain()
+                await reader.readline()
+            assert len(server.sessions) == 3
+            writer.close()
+            for _ in range(100):
+                if not server.sessions:
+                    break
+                await asyncio.sleep(0.01)
+            assert not server.sessions
+        finally:
+            listener.close()
+            await server.stop()
+    run(main())
+
+
+def test_stats_are_strict_json_before_any_search():
+    async def main():
+        server = GameServer(tablebase=False, book=False)
+        await server.start()
+        try:
+            reply = await LocalClient(server).request(op="stats")
+        finally:
+            await server.stop()
+        json.dumps(reply, allow_nan=False)
+        assert reply["latency_ms"]["p50"] is None
+    run(main())
+
+
+def test_session_searched_elsewhere_closes_after_the_search():
+    async def main():
+        server = GameServer(depth=2, tablebase=False, book=False)
+        search = server.search
+        release = threading.Event()
+
+        def held_search(pos):
+            release.wait(5)
+            return search(pos)
+        server.search = held_search
+        await server.start()
+        listener = await asyncio.start_server(server.serve_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b'{"op": "new"}\n')
+            await writer.drain()
+            session = json.loads(await reader.readline())["session"]
+            # Another client asks for a move in the same game, then the owner leaves
+            go = asyncio.create_task(LocalClient(server).request(op="go", session=session))
+            while not server.sessions[session].busy:
+                await asyncio.sleep(0.01)
+            writer.close()
+            while not server.sessions[session].closing:
+                await asyncio.sleep(0.01)
+            release.set()
+            reply = await go
+            assert reply["move"] is not None
+            assert not server.sessions
+        finally:
+            release.set()
+            listener.close()
+            await server.stop()
+    run(main())
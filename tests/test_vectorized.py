@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import vectorized
+from conftest import GEOMETRIES, random_games
+from engine import Engine, Geometry, Position, Search
+
+
+def game_positions(geometry, games=20, seed=1):
+    return [pos.copy() for pos, _ in random_games(geometry, games, seed)]
+
+
+@pytest.mark.parametrize("geometry", GEOMETRIES, ids=repr)
+def test_matches_position_evaluate(geometry):
+    positions = list(game_positions(geometry))
+    expected = [pos.evaluate() for pos in positions]
+    assert vectorized.evaluate_positions(positions) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("geometry", GEOMETRIES[:2], ids=repr)
+def test_board_codes_match_bitboards(geometry):
+    positions = list(game_positions(geometry, games=5))
+    bitboards = [(p.pawns[0], p.pawns[1], p.blockers[0], p.blockers[1]) for p in positions]
+    planes = vectorized.planes_from_boards(vectorized.encode(positions), geometry)
+    assert (planes == vectorized.planes_from_bitboards(bitboards, geometry)).all()
+
+
+def test_weighted_geometry():
+    geometry = Geometry(5, 5).with_weights((1.3, 1.1, 0.4, -0.2, 0.3, 0.5))
+    positions = list(game_positions(geometry, games=5))
+    assert vectorized.evaluate_positions(positions) == pytest.approx([pos.evaluate() for pos in positions])
+
+
+def test_mixed_boards_rejected():
+    with pytest.raises(ValueError):
+        vectorized.evaluate_positions([Position.initial(), Position.initial(Geometry(5, 5))])
+
+
+@pytest.mark.parametrize("geometry", GEOMETRIES[:2], ids=repr)
+def test_batched_leaves_search_the_same(geometry):
+    for pos in list(game_positions(geometry, games=3))[::4]:
+        serial = Search().iterate(pos, 3)
+        batched = Search(leaf_evaluator=vectorized.evaluate_bitboards).iterate(pos, 3)
+        assert batched[0] == serial[0]
+        assert batched[1] == pytest.approx(serial[1])
+
+
+def test_batched_leaves_use_the_engine_weights():
+    weights = (1, 1.1, 0.4, 0.05, 0.3, 0.5)
+    for geometry in GEOMETRIES[:2]:
+        for pos in list(game_positions(geometry, games=3))[::3]:
+            serial = Engine(max_depth=3, weights=weights, instrument=True)
+            batched = Engine(max_depth=3, weights=weights, instrument=True,
+                             leaf_evaluator=vectorized.evaluate_bitboards)
+            # Equal scores can still pick different moves, so only the scores are compared
+            batched.choose_move(pos)
+            serial.choose_move(pos)
+            assert batched.stats.value == pytest.approx(serial.stats.value)
+
+
+def test_boards_parsed_separately_batch_together():
+    texts = ["bbbbb/.B.../...../...W./wwwww w", "bbbbb/.B.../...../w..W./.wwww b"]
+    positions = [Position.from_text(text) for text in texts]
+    assert vectorized.evaluate_positions(positions) == pytest.approx([pos.evaluate() for pos in positions])
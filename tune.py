@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from arena import play_match, print_summary, summarize
+from engine import (BLACK, DEFAULT_WEIGHTS, DEFAULT_WEIGHTS_PATH, WEIGHT_NAMES, WHITE, Engine, Position,
+                    TranspositionTable, load_weights)
+from vectorized import features, planes_from_bitboards
+
+# Game results as the probability that black wins, matching black-minus-white scores
+RESULT_LABELS = {BLACK: 1.0, WHITE: 0.0, None: 0.5}
+
+
+def play_game(task):
+    # One self-play game from a random opening, with an occasional random
+    # move for variety. Returns every position after the opening as packed
+    # bitboards, and the result.
+    seed, depth, opening_plies, noise, weights = task
+    rng = random.Random(seed)
+    engine = Engine(max_depth=depth, tt=TranspositionTable(1), weights=weights)
+    pos = Position.initial()
+    boards = []
+    ply = 0
+    while pos.winner() is None:
+        moves = pos.generate_moves()
+        if not moves:
+            break
+        if ply < opening_plies or rng.random() < noise:
+            move = rng.choice(moves)
+        else:
+            move = engine.choose_move(pos)
+        if ply >= opening_plies:
+            boards.append((pos.pawns[WHITE], pos.pawns[BLACK], pos.blockers[WHITE], pos.blockers[BLACK]))
+        pos.make(move)
+        ply += 1
+    return boards, RESULT_LABELS[pos.winner()]
+
+
+def generate(games, workers, depth, opening_plies, noise, seed, weights=None):
+    # Feature matrix, labels and game index for every position of `games` self-play games
+    rng = random.Random(seed)
+    tasks = [(rng.getrandbits(32), depth, opening_plies, noise, weights) for _ in range(games)]
+    boards = []
+    labels = []
+    game_ids = []
+    with Pool(workers) as pool:
+        for game, (game_boards, label) in enumerate(pool.imap_unordered(play_game, tasks, chunksize=16)):
+            boards.extend(game_boards)
+            labels.extend([label] * len(game_boards))
+            game_ids.extend([game] * len(game_boards))
+    return features(planes_from_bitboards(boards)), np.array(labels), np.array(game_ids)
+
+
+def split_games(game_ids, holdout, seed):
+    # Training and held-out masks over positions. Whole games go to one side:
+    # positions of one game share a label, so splitting a game leaks it.
+    games = np.unique(game_ids)
+    held = np.random.default_rng(seed).permutation(games)[:int(round(len(games) * holdout))]
+    test = np.isin(game_ids, held)
+    return ~test, test
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def loss(x, y, weights, k):
+    # Texel loss: mean squared error between results and the predicted win chance
+    return float(np.mean((y - sigmoid(k * (x @ weights))) ** 2))
+
+
+def fit_k(x, y, weights):
+    # Scale from evaluation units to win chance that best fits the current weights
+    candidates = np.exp(np.linspace(np.log(0.01), np.log(20), 200))
+    losses = [loss(x, y, weights, k) for k in candidates]
+    return float(candidates[int(np.argmin(losses))])
+
+
+def fit(x, y, weights, k, iterations=2000, rate=0.01, l2=0.0):
+    # Adam on the Texel loss with k fixed; every step uses the whole data set.
+    # The pawn value stays put as the unit the other weights are measured in,
+    # an L2 term pulls the rest toward where they started, and every weight
+    # is kept at or above zero, since each feature counts something good for
+    # its side. Without these the fit trades one correlated term against
+    # another, e.g. a large pawn value against a negative center bonus.
+    start = np.array(weights, dtype=float)
+    weights = start.copy()
+    free = np.array([name != "pawns" for name in WEIGHT_NAMES])
+    m = np.zeros_like(weights)
+    v = np.zeros_like(weights)
+    beta1, beta2 = 0.9, 0.999
+    for step in range(1, iterations + 1):
+        p = sigmoid(k * (x @ weights))
+        gradient = x.T @ (2 * (p - y) * p * (1 - p) * k) / len(y) + 2 * l2 * (weights - start)
+        gradient[~free] = 0
+        m = beta1 * m + (1 - beta1) * gradient
+        v = beta2 * v + (1 - beta2) * gradient ** 2
+        weights -= rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + 1e-12)
+        np.maximum(weights, 0, out=weights)
+    return weights
+
+
+def arena_check(path, start_path, depths, games, opening_plies, workers, seed):
+    # Arena summary per depth of the weights in `path` against the starting ones
+    results = {}
+    with Pool(workers) as pool:
+        for depth in depths:
+            players = (f"depth={depth},weights={path}",
+                       f"depth={depth}" + (f",weights={start_path}" if start_path else ""))
+            records = list(play_match(pool, players, games, opening_plies, seed))
+            results[depth] = summarize(records, players[0])
+    return results
+
+
+def save(path, weights, **info):
+    with open(path, "w") as f:
+        json.dump({"weights": dict(zip(WEIGHT_NAMES, (round(float(w), 6) for w in weights))), **info}, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune the evaluation weights on self-play results.")
+    parser.add_argument("-n", "--games", type=int, default=4000)
+    parser.add_argument("--depth", type=int, default=2, help="self-play search depth")
+    parser.add_argument("--opening-plies", type=int, default=2, help="random plies before the engines take over")
+    parser.add_argument("--noise", type=float, default=0.1, help="chance of a random move after the opening")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--start", metavar="PATH", help="weights file to start from instead of the defaults")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--l2", type=float, default=0.01, help="pull of each weight toward its starting value")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of games kept out of the fit")
+    parser.add_argument("--check-games", type=int, default=400,
+                        help="arena games per depth against the starting weights; 0 skips the check")
+    parser.add_argument("--check-depths", default="2,4", help="comma-separated arena search depths")
+    parser.add_argument("-o", "--output", default=DEFAULT_WEIGHTS_PATH)
+    args = parser.parse_args(argv)
+
+    start = load_weights(args.start) if args.start else DEFAULT_WEIGHTS
+    start_time = time.perf_counter()
+    x, y, game_ids = generate(args.games, args.workers, args.depth, args.opening_plies, args.noise, args.seed, start)
+    print(f"{len(y)} positions from {args.games} games in {time.perf_counter() - start_time:.1f} s")
+
+    train, test = split_games(game_ids, args.holdout, args.seed)
+    k = fit_k(x[train], y[train], np.array(start))
+    start_loss = loss(x[test], y[test], np.array(start), k)
+    fit_time = time.perf_counter()
+    weights = fit(x[train], y[train], start, k, args.iterations, l2=args.l2)
+    end_loss = loss(x[test], y[test], weights, k)
+    print(f"k={k:.3f}, held-out loss {start_loss:.5f} -> {end_loss:.5f} "
+          f"({time.perf_counter() - fit_time:.1f} s fit)")
+    for name, before, after in zip(WEIGHT_NAMES, start, weights):
+        print(f"  {name:12s} {before:7.3f} -> {after:7.3f}")
+
+    info = dict(k=k, loss=end_loss, positions=len(y), games=args.games, depth=args.depth)
+    if args.check_games:
+        # A lower loss does not make a stronger player; only keep weights
+        # that beat the ones they started from at every checked depth
+        fd, candidate = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            save(candidate, weights)
+            depths = [int(depth) for depth in args.check_depths.split(",")]
+            results = arena_check(candidate, args.start, depths, args.check_games, args.opening_plies,
+                                  args.workers, args.seed)
+        finally:
+            os.remove(candidate)
+        for depth, summary in results.items():
+            print_summary(summary)
+        if not all(summary["score"] > 0.5 for summary in results.values()):
+            print(f"The new weights do not beat the starting ones; {args.output} is unchanged")
+            return 1
+        info["arena"] = {depth: {"games": summary["games"], "score": round(summary["score"], 4),
+                                 "elo": round(summary["elo"], 1)} for depth, summary in results.items()}
+
+    save(args.output, weights, **info)
+    print(f"Wrote {args.output}; compare with: python arena.py -a depth=4,weights={args.output} -b depth=4")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
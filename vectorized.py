@@ -0,0 +1,143 @@
+import numpy as np
+
+from engine import BLACK, DEFAULT, DEFAULT_WEIGHTS, WEIGHT_NAMES, WHITE
+
+# Boards of any size: planes are (N, 4, rows, cols) and the masks follow
+# their shape. Anything that starts from packed bitboards or square codes
+# takes the Geometry they belong to, the standard 4x4 board by default.
+
+# Square codes for the N x squares int8 board encoding
+EMPTY, WHITE_PAWN, WHITE_BLOCKER, BLACK_PAWN, BLACK_BLOCKER = 0, 1, 2, -1, -2
+
+# Feature columns, each black minus white, and the weights Position.evaluate uses
+FEATURES = WEIGHT_NAMES
+WEIGHTS = np.array(DEFAULT_WEIGHTS)
+
+# Plane order in the (N, 4, rows, cols) boolean stack
+WP, BP, WB, BB = range(4)
+
+
+def shared_geometry(positions):
+    # The one geometry all positions are on; batches cannot mix board sizes
+    geometries = {pos.geometry for pos in positions}
+    if len(geometries) > 1:
+        raise ValueError("positions on different boards cannot be batched together")
+    return geometries.pop() if geometries else DEFAULT
+
+
+def encode(positions):
+    # Positions -> N x squares int8 boards in row-major square order
+    geometry = shared_geometry(positions)
+    boards = np.zeros((len(positions), geometry.squares), dtype=np.int8)
+    for i, pos in enumerate(positions):
+        boards[i] = board_row(pos)
+    return boards
+
+
+def board_row(pos):
+    squares = pos.geometry.squares
+    row = [EMPTY] * squares
+    for code, bb in ((WHITE_PAWN, pos.pawns[WHITE]), (BLACK_PAWN, pos.pawns[BLACK]),
+                     (WHITE_BLOCKER, pos.blockers[WHITE]), (BLACK_BLOCKER, pos.blockers[BLACK])):
+        for sq in range(squares):
+            if bb >> sq & 1:
+                row[sq] = code
+    return row
+
+
+def planes_from_boards(boards, geometry=DEFAULT):
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, geometry.rows, geometry.cols)
+    return np.stack([boards == WHITE_PAWN, boards == BLACK_PAWN,
+                     boards == WHITE_BLOCKER, boards == BLACK_BLOCKER], axis=1)
+
+
+def planes_from_bitboards(bitboards, geometry=DEFAULT):
+    # N x 4 packed bitboards (white pawns, black pawns, white blockers, black blockers)
+    if geometry.squares > 64:
+        raise ValueError(f"{geometry} does not fit in 64-bit bitboards")
+    bitboards = np.asarray(bitboards, dtype=np.uint64).reshape(-1, 4)
+    shifts = np.arange(geometry.squares, dtype=np.uint64)
+    unpacked = (bitboards[:, :, None] >> shifts) & np.uint64(1)
+    return unpacked.astype(bool).reshape(-1, 4, geometry.rows, geometry.cols)
+
+
+def center_mask(rows, cols):
+    # The middle two rows and files, or the middle one when odd, as in Geometry
+    mask = np.zeros((rows, cols), dtype=bool)
+    mask[(rows - 1) // 2:rows // 2 + 1, (cols - 1) // 2:cols // 2 + 1] = True
+    return mask
+
+
+def _count(mask):
+    return mask.sum(axis=(1, 2))
+
+
+def mobility(planes):
+    # Legal move counts per side, using the same rules as Position.piece_moves
+    wp, bp, wb, bb = planes[:, WP], planes[:, BP], planes[:, WB], planes[:, BB]
+    empty = ~(wp | bp | wb | bb)
+    # White moves up: a pawn on row r targets row r - 1
+    white = (_count(wp[:, 1:, :] & empty[:, :-1, :])
+             + _count(wp[:, 1:, 1:] & bp[:, :-1, :-1])
+             + _count(wp[:, 1:, :-1] & bp[:, :-1, 1:])
+             + _count(wp[:, 1:, :-1] & wp[:, 1:, 1:] & bb[:, :-1, 1:])
+             + _count(wp[:, 1:, 1:] & wp[:, 1:, :-1] & bb[:, :-1, :-1]))
+    # Black moves down: a pawn on row r targets row r + 1
+    black = (_count(bp[:, :-1, :] & empty[:, 1:, :])
+             + _count(bp[:, :-1, 1:] & wp[:, 1:, :-1])
+             + _count(bp[:, :-1, :-1] & wp[:, 1:, 1:])
+             + _count(bp[:, :-1, :-1] & bp[:, :-1, 1:] & wb[:, 1:, 1:])
+             + _count(bp[:, :-1, 1:] & bp[:, :-1, :-1] & wb[:, 1:, :-1]))
+    return white, black
+
+
+def features(planes):
+    # N x 6 matrix of black-minus-white feature counts, columns as in FEATURES
+    wp, bp, wb, bb = planes[:, WP], planes[:, BP], planes[:, WB], planes[:, BB]
+    white_pieces, black_pieces = wp | wb, bp | bb
+    white_moves, black_moves = mobility(planes)
+    rows, cols = planes.shape[2:]
+    row_index = np.arange(rows).reshape(rows, 1)
+    center = center_mask(rows, cols)
+    out = np.empty((len(planes), len(FEATURES)))
+    out[:, 0] = _count(bp) - _count(wp)
+    out[:, 1] = _count(bb) - _count(wb)
+    # Rows still to travel count for white, rows travelled for black
+    out[:, 2] = _count(bp * row_index) - _count(wp * (rows - row_index))
+    out[:, 3] = _count(black_pieces & center) - _count(white_pieces & center)
+    out[:, 4] = black_moves - white_moves
+    out[:, 5] = black_pieces[:, -1, :].sum(axis=1) - white_pieces[:, 0, :].sum(axis=1)
+    return out
+
+
+def evaluate_terms(planes, weights=WEIGHTS):
+    # Weighted material, positional, center, mobility and back-row terms
+    weighted = features(planes) * weights
+    return {
+        "material": weighted[:, 0] + weighted[:, 1],
+        "positional": weighted[:, 2],
+        "center": weighted[:, 3],
+        "mobility": weighted[:, 4],
+        "back_row": weighted[:, 5],
+    }
+
+
+def evaluate(planes, weights=WEIGHTS):
+    # Position.evaluate for every position at once (black minus white)
+    return features(planes) @ weights
+
+
+def evaluate_bitboards(bitboards, weights=None, geometry=DEFAULT):
+    # Leaf evaluator for Search: a list of (wp, bp, wb, bb) tuples on one
+    # geometry -> list of scores, with the geometry's own weights unless
+    # others are given. Search passes the geometry by keyword.
+    if weights is None:
+        weights = np.asarray(geometry.weights, dtype=float)
+    return evaluate(planes_from_bitboards(bitboards, geometry), weights).tolist()
+
+
+def evaluate_positions(positions):
+    # Position.evaluate for each position, with each board's own weights
+    geometry = shared_geometry(positions)
+    return evaluate_bitboards([(p.pawns[WHITE], p.pawns[BLACK], p.blockers[WHITE], p.blockers[BLACK])
+                               for p in positions], geometry=geometry)